@@ -0,0 +1,159 @@
+# batch_render.py
+"""
+批量重新合成报纸图片(比如活动结束后更换了模板)：
+
+    python batch_render.py captured_photos/ --weather "晴 25℃" -o out/
+    python batch_render.py "captured_photos/*.jpg" --date 2025-03-05 -o out/
+
+每个进程各自持有一个常驻的 NewspaperCompositor，模板只解码一次。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from image_utils import COMPOSITOR_BACKEND, COMPOSITOR_BACKENDS, OUTPUT_PRESETS, TEMPLATE_PATH, \
+    create_compositor
+
+PHOTO_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# 每个工作进程里的合成器，由 _init_worker 创建
+_worker_compositor = None
+
+
+def collect_photos(input_path):
+    """
+    input_path 可以是目录，也可以是 glob 表达式
+    """
+    if os.path.isdir(input_path):
+        paths = [os.path.join(input_path, name) for name in os.listdir(input_path)]
+    else:
+        paths = glob.glob(input_path)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(PHOTO_EXTS))
+
+
+def output_names(photo_paths, out_ext):
+    """
+    每张照片的输出文件名(不含目录)，保证互不相同：
+    同名不同扩展名(a.jpg / a.png)时保留源扩展名(a_jpg / a_png)，
+    不同目录下的同名文件再加序号(a_jpg_2)，避免后合成的覆盖先合成的
+    """
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in photo_paths]
+    counts = {}
+    for stem in stems:
+        counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+
+    names = []
+    used = set()
+    for photo_path, stem in zip(photo_paths, stems):
+        if counts[stem.lower()] > 1:
+            stem += "_" + os.path.splitext(photo_path)[1].lstrip(".").lower()
+        name, n = stem, 1
+        while name.lower() in used:
+            n += 1
+            name = f"{stem}_{n}"
+        used.add(name.lower())
+        names.append(name + out_ext)
+    return names
+
+
+def _init_worker(template_path, font_path, output_encoder, backend=None):
+    global _worker_compositor
+    _worker_compositor = create_compositor(backend, template_path=template_path, font_path=font_path,
+                                           output_encoder=output_encoder)
+
+
+def _render_one(photo_path, output_path, weather_str, now_date):
+    """
+    在工作进程中合成一张，返回 (输出路径, 耗时秒)
+    """
+    start = time.perf_counter()
+    _worker_compositor.render_to_file(photo_path, output_path=output_path, weather_str=weather_str,
+                                      now_date=now_date)
+    return output_path, time.perf_counter() - start
+
+
+def batch_render(photo_paths, output_dir, weather_str, now_date=None, workers=None,
+                 template_path=None, font_path=None, output_encoder=None, backend=None):
+    """
+    用进程池批量合成，边完成边打印进度。backend 见 image_utils.create_compositor
+    return: {"total", "ok", "failed", "elapsed", "images_per_sec"}
+    """
+    template_path = template_path or TEMPLATE_PATH
+    output_encoder = output_encoder or OUTPUT_PRESETS["png"]
+    out_ext = output_encoder.extension
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    total = len(photo_paths)
+    done = 0
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(template_path, font_path, output_encoder, backend)) as pool:
+        futures = {}
+        for photo_path, name in zip(photo_paths, output_names(photo_paths, out_ext)):
+            output_path = os.path.join(output_dir, name)
+            fut = pool.submit(_render_one, photo_path, output_path, weather_str, now_date)
+            futures[fut] = photo_path
+
+        for fut in as_completed(futures):
+            done += 1
+            try:
+                output_path, cost = fut.result()
+                print(f"[{done}/{total}] {output_path} ({cost * 1000:.0f} ms)")
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{total}] 合成失败 {futures[fut]}: {e}")
+
+    elapsed = time.perf_counter() - start
+    ok = total - failed
+    return {
+        "total": total,
+        "ok": ok,
+        "failed": failed,
+        "workers": workers,
+        "elapsed": elapsed,
+        "images_per_sec": ok / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量把照片重新合成为报纸图片")
+    parser.add_argument("input", help="照片目录或 glob，如 'photos/*.jpg'")
+    parser.add_argument("-o", "--output-dir", default="batch_output", help="输出目录")
+    parser.add_argument("--weather", default=None, help="天气字符串，如 '晴 25℃'；不填则调用 get_weather_info()")
+    parser.add_argument("--date", default=None, help="报纸日期 YYYY-MM-DD，默认今天")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--template", default=None, help="模板路径")
+    parser.add_argument("--format", default="png", choices=sorted(OUTPUT_PRESETS), help="输出编码预设")
+    parser.add_argument("--backend", default=COMPOSITOR_BACKEND, choices=COMPOSITOR_BACKENDS,
+                        help="合成后端：pil 或 cv(NumPy/OpenCV)")
+    args = parser.parse_args(argv)
+
+    photo_paths = collect_photos(args.input)
+    if not photo_paths:
+        print("没有找到需要合成的照片:", args.input)
+        return 1
+
+    weather_str = args.weather
+    if weather_str is None:
+        from weather_utils import get_weather_info
+        weather_str = get_weather_info()
+    now_date = datetime.strptime(args.date, "%Y-%m-%d") if args.date else None
+
+    print(f"共 {len(photo_paths)} 张照片，天气：{weather_str}")
+    stats = batch_render(photo_paths, args.output_dir, weather_str, now_date=now_date,
+                         workers=args.workers, template_path=args.template,
+                         output_encoder=OUTPUT_PRESETS[args.format], backend=args.backend)
+    print(f"完成 {stats['ok']}/{stats['total']}，失败 {stats['failed']}，"
+          f"{stats['workers']} 进程，耗时 {stats['elapsed']:.2f}s，"
+          f"吞吐 {stats['images_per_sec']:.1f} 张/秒")
+    return 0 if stats["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
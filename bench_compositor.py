@@ -0,0 +1,249 @@
+# bench_compositor.py
+"""
+报纸合成流水线的基准测试：按阶段分别计时(模板解码、照片解码、缩放粘贴、文字、编码)，
+每个阶段调用的都是合成器自己的方法，
+覆盖 VGA / 720p / 1080p / 4K 几种拍摄尺寸和多种输出格式，并记录每种尺寸的峰值内存。
+
+    python bench_compositor.py                          # 打印结果
+    python bench_compositor.py --save-baseline          # 记录当前结果为基线
+    python bench_compositor.py --check                  # 与基线对比，有阶段变慢超过阈值则返回 1
+
+另外对比两个合成后端(PIL / NumPy+OpenCV)：同一帧 BGR 画面各自 render 的耗时，
+以及两者输出的像素差(cv_pixel_diff，照片区域缩放算法不同，其余部分应为 0)。
+每种输入尺寸在独立的子进程里跑，峰值内存(ru_maxrss)互不影响。
+报告里是各阶段的中位数；回退判断用最小值，受机器抖动的影响更小。
+基线与机器相关，请在目标 kiosk 硬件上生成。
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_utils import NewspaperCompositor, OUTPUT_PRESETS, create_compositor, format_date_str
+from template_pack import clear_template_pack_cache
+
+INPUT_SIZES = {
+    "vga": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+BASELINE_PATH = "bench_compositor_baseline.json"
+# 变慢超过这个比例算回退
+DEFAULT_THRESHOLD = 0.25
+# 绝对差值小于这个毫秒数时忽略(计时噪声)
+NOISE_FLOOR_MS = 1.0
+SAMPLE_PHOTO = "captured.jpg"
+WEATHER_STR = "多云 4℃"
+
+
+def make_capture_jpeg(size):
+    """
+    生成指定尺寸的 JPEG 照片(用 captured.jpg 放大，没有就用渐变图)，返回编码后的字节
+    """
+    if os.path.exists(SAMPLE_PHOTO):
+        with Image.open(SAMPLE_PHOTO) as im:
+            photo = im.convert("RGB").resize(size)
+    else:
+        photo = Image.linear_gradient("L").convert("RGB").resize(size)
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def peak_rss_mb():
+    """
+    当前进程的峰值常驻内存(MB)；没有 resource 模块的平台(Windows)返回 None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    if sys.platform == "darwin":
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+def time_stage(fn, repeat):
+    """
+    return: ((中位数ms, 最小值ms), 最后一次的返回值)
+    """
+    costs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        costs.append((time.perf_counter() - start) * 1000)
+    return (statistics.median(costs), min(costs)), result
+
+
+def bench_one_size(name, size, repeat, formats):
+    """
+    在子进程里运行：测一种输入尺寸的各个阶段，返回各阶段的中位数/最小毫秒数和峰值内存
+    """
+    jpeg_bytes = make_capture_jpeg(size)
+    baseline_rss = peak_rss_mb()
+    stages = {}
+
+    # 各阶段都调用合成器自己的方法(render 内部也是这几步)，合成代码变慢时 --check 能发现
+    def decode_template():
+        # 新的合成器第一次取模板：解码 PNG(或映射模板包)并加载字体。
+        # 先清掉进程内的模板包缓存，否则除第一次外测到的都是缓存命中
+        clear_template_pack_cache()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return NewspaperCompositor().get_template()
+
+    stages["template_decode"], _ = time_stage(decode_template, repeat)
+    compositor = NewspaperCompositor()
+    stages["template_copy"], (canvas, layout) = time_stage(compositor.new_canvas, repeat)
+    stages["photo_decode"], photo = time_stage(
+        lambda: compositor.decode_photo(io.BytesIO(jpeg_bytes)), repeat)
+    stages["photo_resize_paste"], _ = time_stage(lambda: compositor.paste_photo(canvas, photo, layout), repeat)
+
+    font = compositor.get_font()
+    date_str = format_date_str()
+    stages["text_rasterize"], _ = time_stage(
+        lambda: compositor._rasterize_header(date_str, WEATHER_STR, font, layout=layout), repeat)
+    stages["text_cached_layer"], _ = time_stage(
+        lambda: compositor.paste_header(canvas, date_str, WEATHER_STR), repeat)
+
+    for fmt in formats:
+        encoder = OUTPUT_PRESETS[fmt]
+        stages[f"encode_{fmt}"], _ = time_stage(lambda: compositor.encode(canvas, encoder), repeat)
+
+    # 端到端：常驻合成器 render(含照片解码) + 默认 PNG 编码
+    stages["end_to_end_png"], _ = time_stage(
+        lambda: compositor.render_bytes(io.BytesIO(jpeg_bytes), WEATHER_STR, output_encoder=OUTPUT_PRESETS["png"]),
+        repeat)
+
+    # ndarray 后端：同样的端到端流程，以及直接合成摄像头 BGR 帧(GUI 的路径)
+    cv_comp = create_compositor("cv")
+    stages["end_to_end_png_cv"], _ = time_stage(
+        lambda: cv_comp.encode(cv_comp.render_array(io.BytesIO(jpeg_bytes), WEATHER_STR)), repeat)
+    frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+    stages["render_frame_pil"], pil_out = time_stage(lambda: compositor.render(frame, WEATHER_STR), repeat)
+    stages["render_frame_cv"], cv_out = time_stage(lambda: cv_comp.render_array(frame, WEATHER_STR), repeat)
+    diff = np.abs(np.asarray(pil_out, dtype=np.int16) - cv_out[:, :, ::-1].astype(np.int16))
+
+    return {
+        "input": name,
+        "size": list(size),
+        "stages_ms": {k: round(v[0], 3) for k, v in stages.items()},
+        "stages_min_ms": {k: round(v[1], 3) for k, v in stages.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_before_mb": baseline_rss,
+        "cv_pixel_diff": {"max": int(diff.max()), "mean": round(float(diff.mean()), 4)},
+    }
+
+
+def _child_entry(args):
+    name, size, repeat, formats = args
+    return bench_one_size(name, size, repeat, formats)
+
+
+def run_suite(inputs, repeat, formats):
+    # spawn：每个尺寸都是干净的进程，峰值内存只反映这一种尺寸
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in inputs:
+        with ctx.Pool(1) as pool:
+            results[name] = pool.apply(_child_entry, ((name, INPUT_SIZES[name], repeat, formats),))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线对比，return 回退列表 [(输入, 阶段, 基线ms, 当前ms)]
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for stage, cost in result["stages_min_ms"].items():
+            base_cost = base.get("stages_min_ms", {}).get(stage)
+            if base_cost is None:
+                continue
+            if cost > base_cost * (1 + threshold) and cost - base_cost > NOISE_FLOOR_MS:
+                regressions.append((name, stage, base_cost, cost))
+    return regressions
+
+
+def print_table(results):
+    stages = list(next(iter(results.values()))["stages_ms"])
+    names = list(results)
+    print(f"{'stage (ms)':<20}" + "".join(f"{n:>12}" for n in names))
+    for stage in stages:
+        print(f"{stage:<20}" + "".join(f"{results[n]['stages_ms'][stage]:>12.2f}" for n in names))
+    print(f"{'peak_rss_mb':<20}" + "".join(f"{str(results[n]['peak_rss_mb']):>12}" for n in names))
+    print(f"{'cv_diff max/mean':<20}" + "".join(
+        f"{results[n]['cv_pixel_diff']['max']:>6}/{results[n]['cv_pixel_diff']['mean']:<5.3f}" for n in names))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="报纸合成流水线基准测试")
+    parser.add_argument("--inputs", default=",".join(INPUT_SIZES), help="输入尺寸，逗号分隔: vga,720p,1080p,4k")
+    parser.add_argument("--formats", default=",".join(OUTPUT_PRESETS), help="输出编码预设，逗号分隔")
+    parser.add_argument("-n", "--repeat", type=int, default=7, help="每个阶段重复次数")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线 JSON 路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--check", action="store_true", help="与基线对比，回退时返回非 0")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许变慢的比例")
+    parser.add_argument("-o", "--output", default=None, help="把本次结果写到 JSON 文件")
+    args = parser.parse_args(argv)
+
+    inputs = [s.strip() for s in args.inputs.split(",") if s.strip()]
+    formats = [s.strip() for s in args.formats.split(",") if s.strip()]
+    for name in inputs:
+        if name not in INPUT_SIZES:
+            parser.error(f"未知的输入尺寸: {name}")
+    for fmt in formats:
+        if fmt not in OUTPUT_PRESETS:
+            parser.error(f"未知的输出格式: {fmt}")
+
+    results = run_suite(inputs, args.repeat, formats)
+    print_table(results)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"找不到基线 {args.baseline}，请先运行 --save-baseline")
+            return 2
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"以下阶段比基线慢超过 {args.threshold:.0%}：")
+            for name, stage, base_cost, cost in regressions:
+                print(f"  {name:<6} {stage:<20} {base_cost:.2f} ms -> {cost:.2f} ms")
+            return 1
+        print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# bench_pay_client.py
+"""
+对比每次请求都重新加载私钥、新建连接的旧写法，和复用 PayClient 的单次调用耗时：
+
+    python bench_pay_client.py -n 200
+    python bench_pay_client.py --bulk 2000 --concurrency 32   # 对账场景：批量查单
+
+在本进程后台线程里启动 fake_server，不需要联网；批量查单时 fake_server 以独立进程运行，
+并可用 --latency-ms 模拟真实接口的网络往返。
+没有 resource/merchant_key.pem 时会临时生成一把 RSA 密钥。
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import fake_server
+import pay_v3
+
+
+def ensure_private_key_file():
+    """
+    返回可用的私钥路径，没有就生成一个临时的
+    """
+    if os.path.exists(pay_v3.MERCHANT_PRIVATE_KEY_PATH):
+        return pay_v3.MERCHANT_PRIVATE_KEY_PATH
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    fd, path = tempfile.mkstemp(prefix="bench_key_", suffix=".pem")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    return path
+
+
+def legacy_query(host, key_path, out_trade_no):
+    """
+    旧写法：每次都重新解析 PEM，并用裸 requests.get 新建连接
+    """
+    private_key = pay_v3.load_merchant_private_key(key_path)
+    path = f"/v3/pay/transactions/out-trade-no/{out_trade_no}?mchid=mock"
+    authorization = pay_v3.generate_authorization(
+        method="GET", url=path, body="", mchid="mock",
+        serial_no=pay_v3.MERCHANT_CERT_SERIAL_NO, private_key=private_key,
+    )
+    resp = requests.get(host + path, headers={"Authorization": authorization}, timeout=10)
+    return resp.json().get("trade_state")
+
+
+def timed(fn, n):
+    costs = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        costs.append((time.perf_counter() - start) * 1000)
+    costs.sort()
+    return {
+        "mean_ms": statistics.mean(costs),
+        "p50_ms": costs[len(costs) // 2],
+        "p95_ms": costs[min(int(len(costs) * 0.95), len(costs) - 1)],
+    }
+
+
+def bench_bulk(host, key_path, count, concurrency):
+    """
+    端到端验证批量查单：先下 count 个单，把其中一半模拟支付成功，
+    再分别用逐个查询和 AsyncPayClient 并发查询，核对结果并对比耗时
+    """
+    client = pay_v3.PayClient(host=host, mchid="mock", private_key_path=key_path)
+    prefix = f"BULK{int(time.time())}"
+    trade_nos = [f"{prefix}{i:06d}" for i in range(count)]
+    for no in trade_nos:
+        client.unified_order(no, 1, "bench")
+    paid = set(trade_nos[::2])
+    for no in paid:
+        client.session.post(f"{host}/fakepay/{no}", timeout=10)
+
+    start = time.perf_counter()
+    sequential = {no: client.query_order(no) for no in trade_nos}
+    sequential_cost = time.perf_counter() - start
+    client.close()
+
+    start = time.perf_counter()
+    bulk = pay_v3.query_orders_bulk(trade_nos, concurrency=concurrency,
+                                    host=host, mchid="mock", private_key_path=key_path)
+    bulk_cost = time.perf_counter() - start
+
+    expected = {no: ("SUCCESS" if no in paid else "NOTPAY") for no in trade_nos}
+    print(f"批量查单 {count} 个，并发 {concurrency}")
+    print(f"逐个查询: {sequential_cost:.2f}s, 结果{'正确' if sequential == expected else '不一致'}")
+    print(f"并发查询: {bulk_cost:.2f}s, 结果{'正确' if bulk == expected else '不一致'}")
+    print(f"加速: {sequential_cost / bulk_cost:.2f}x")
+    return bulk == expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PayClient 单次调用耗时基准")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="每种写法的请求次数")
+    parser.add_argument("--port", type=int, default=8011, help="fake_server 端口")
+    parser.add_argument("--bulk", type=int, default=0, help="批量查单的订单数，不为 0 时只跑批量查单")
+    parser.add_argument("--concurrency", type=int, default=16, help="批量查单的并发上限")
+    parser.add_argument("--latency-ms", type=float, default=20, help="批量查单时 mock server 模拟的网络延迟")
+    args = parser.parse_args(argv)
+
+    host = f"http://127.0.0.1:{args.port}"
+    key_path = ensure_private_key_file()
+    if args.bulk:
+        proc = fake_server.spawn_process(port=args.port, latency_ms=args.latency_ms)
+        try:
+            ok = bench_bulk(host, key_path, args.bulk, args.concurrency)
+        finally:
+            proc.terminate()
+            proc.wait()
+            if key_path != pay_v3.MERCHANT_PRIVATE_KEY_PATH:
+                os.remove(key_path)
+        return 0 if ok else 1
+
+    # fake_server 每个请求都会打日志，基准测试时关掉
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = fake_server.start_in_thread(port=args.port)
+
+    try:
+        client = pay_v3.PayClient(host=host, mchid="mock", private_key_path=key_path)
+        trade_no = f"BENCH{int(time.time())}"
+        client.unified_order(trade_no, 1, "bench")
+
+        # 先各跑几次预热(导入、首次连接)
+        for _ in range(3):
+            legacy_query(host, key_path, trade_no)
+            client.query_order(trade_no)
+
+        legacy = timed(lambda: legacy_query(host, key_path, trade_no), args.requests)
+        pooled = timed(lambda: client.query_order(trade_no), args.requests)
+        client.close()
+    finally:
+        server.shutdown()
+        if key_path != pay_v3.MERCHANT_PRIVATE_KEY_PATH:
+            os.remove(key_path)
+
+    print(f"请求次数: {args.requests}")
+    for name, stats in (("旧写法(每次加载私钥+新连接)", legacy), ("PayClient(缓存私钥+连接池)", pooled)):
+        print(f"{name}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+    print(f"平均加速: {legacy['mean_ms'] / pooled['mean_ms']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
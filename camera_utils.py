@@ -0,0 +1,174 @@
+import threading
+import time
+import cv2
+
+import metrics
+
+
+class CameraCapture:
+    """
+    后台线程持续读取摄像头，只保留最新的一帧：
+      - Tk 主线程不再直接调用 cap.read()，慢速读帧不会卡住按钮响应
+      - 驱动缓冲区被持续读空，预览不会积压旧帧
+    """
+
+    def __init__(self, device=0, api_preference=None):
+        self.device = device
+        self.api_preference = api_preference
+        self.cap = None
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_seq = 0
+        self._frame_time = 0.0
+        self._running = False
+        self._thread = None
+
+    def open(self):
+        """
+        打开摄像头，成功返回 True
+        """
+        if self.api_preference is None:
+            self.cap = cv2.VideoCapture(self.device)
+        else:
+            self.cap = cv2.VideoCapture(self.device, self.api_preference)
+        if not self.cap.isOpened():
+            print("无法打开摄像头！")
+            return False
+        # 尽量让驱动只缓存 1 帧(部分后端不支持，忽略返回值)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+
+    def start(self):
+        """
+        打开摄像头并启动采集线程，成功返回 True
+        """
+        if self._running:
+            return True
+        if (self.cap is None or not self.cap.isOpened()) and not self.open():
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True)
+        self._thread.start()
+        return True
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                metrics.inc("camera_read_errors")
+                # 读帧失败时稍等再试，避免空转占满 CPU
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self._frame = frame
+                self._frame_seq += 1
+                self._frame_time = time.monotonic()
+
+    def read_latest(self):
+        """
+        取最新一帧，不阻塞。
+        return: (frame, seq)；还没有帧时 frame 为 None。
+        注意返回的是共享的帧，需要在上面画东西时请先 copy()
+        """
+        with self._lock:
+            return self._frame, self._frame_seq
+
+    def frame_age(self):
+        """
+        最新一帧距今的秒数，没有帧时为 None
+        """
+        with self._lock:
+            if self._frame is None:
+                return None
+            return time.monotonic() - self._frame_time
+
+    def is_running(self):
+        return self._running
+
+    def stop(self):
+        """
+        停止采集线程并释放摄像头
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class PreviewRenderer:
+    """
+    预览画面渲染，尽量不在每一帧里分配新内存：
+      - 先缩放到预览大小，再在小图上转色(全分辨率转色太浪费)
+      - 缩放和转色都写进预先分配好的缓冲区(dst=...)
+      - PIL Image 直接共享缓冲区的内存，交给 sink(比如 PhotoImage.paste)原地更新。
+        PIL 只能零拷贝映射每像素 4 字节的模式，所以转成 RGBA 而不是 RGB
+      - 统计实际 FPS 和每帧耗时，方便核对 kiosk 的 CPU 预算
+    """
+
+    def __init__(self, width, height, sink):
+        import numpy as np
+        from PIL import Image
+
+        self.width = width
+        self.height = height
+        self.sink = sink
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgba = np.empty((height, width, 4), dtype=np.uint8)
+        # 与 self._rgba 共享内存，缓冲区更新后 PIL 图像自然就是新画面
+        self._image = Image.frombuffer("RGBA", (width, height), self._rgba, "raw", "RGBA", 0, 1)
+
+        self.frames = 0
+        self._window_start = time.perf_counter()
+        self._window_frames = 0
+        self._window_cost = 0.0
+        self.fps = 0.0
+        self.avg_frame_ms = 0.0
+        self.last_frame_ms = 0.0
+
+    @property
+    def mode(self):
+        """
+        输出图像的模式，PhotoImage 用同样的模式创建时 paste 不会再转换
+        """
+        return self._image.mode
+
+    def render(self, frame, overlay_text=None):
+        """
+        把 BGR 帧渲染到预览上，overlay_text 画在预览图中间(比如倒计时数字)
+        """
+        start = time.perf_counter()
+        cv2.resize(frame, (self.width, self.height), dst=self._resized)
+        if overlay_text:
+            # 画在缩放后的小图上，不会改动原始帧
+            cv2.putText(self._resized, overlay_text,
+                        (int(self.width / 2 - 20), int(self.height / 2)),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        2, (0, 0, 255), 5)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+        self.sink(self._image)
+        self._record(time.perf_counter() - start)
+
+    def _record(self, cost):
+        self.frames += 1
+        self.last_frame_ms = cost * 1000
+        self._window_frames += 1
+        self._window_cost += cost
+        elapsed = time.perf_counter() - self._window_start
+        # 每秒结算一次，得到最近一秒的 FPS 和平均耗时
+        if elapsed >= 1.0:
+            self.fps = self._window_frames / elapsed
+            self.avg_frame_ms = self._window_cost / self._window_frames * 1000
+            self._window_start = time.perf_counter()
+            self._window_frames = 0
+            self._window_cost = 0.0
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "fps": round(self.fps, 1),
+            "avg_frame_ms": round(self.avg_frame_ms, 2),
+            "last_frame_ms": round(self.last_frame_ms, 2),
+        }
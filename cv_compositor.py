@@ -0,0 +1,183 @@
+# cv_compositor.py
+"""
+基于 NumPy/OpenCV 的报纸合成后端，和 NewspaperCompositor 接口相同：
+  - 模板 + 文字层预先合成好，以 BGR ndarray 缓存(按模板/日期/天气)；
+    模板包的像素直接从内存映射读取，不经过 PIL
+  - 每次合成只复制一份缓存数组，cv2.resize(INTER_AREA) 直接写进照片区域的切片
+  - 摄像头的 BGR 帧全程不做颜色转换；只在最后一步编码(cv2.imencode)或转成 PIL
+缩放算法和 PIL 路径不同(INTER_AREA vs BICUBIC)，照片区域会有轻微差异，
+模板和文字部分逐像素一致；对比数据见 bench_compositor.py 的 cv_pixel_diff。
+
+    from image_utils import create_compositor
+    compositor = create_compositor("cv")
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import metrics
+from image_utils import NewspaperCompositor, format_date_str, write_bytes_atomic
+
+# 缓存多少份“模板 + 文字层”的底图(每份约 2.8MB)，日期/天气变化才会产生新的
+BASE_CACHE_SIZE = 4
+
+
+def load_photo_bgr(photo):
+    """
+    把各种形式的照片统一成 BGR uint8 ndarray，支持的类型同 image_utils.load_photo
+    """
+    if isinstance(photo, np.ndarray):
+        if photo.ndim == 2:
+            return cv2.cvtColor(photo, cv2.COLOR_GRAY2BGR)
+        if photo.ndim == 3 and photo.shape[2] >= 3:
+            return photo if photo.shape[2] == 3 else photo[:, :, :3]
+        raise TypeError(f"不支持的照片数组形状: {photo.shape}")
+    if isinstance(photo, Image.Image):
+        rgb = np.asarray(photo if photo.mode == "RGB" else photo.convert("RGB"))
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    if isinstance(photo, (str, os.PathLike)):
+        # np.fromfile + imdecode：Windows 下中文路径也能读
+        data = np.fromfile(photo, dtype=np.uint8)
+    elif hasattr(photo, "read"):
+        data = np.frombuffer(photo.read(), dtype=np.uint8)
+    else:
+        raise TypeError(f"不支持的照片类型: {type(photo)!r}")
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("无法解码照片")
+    return image
+
+
+def imencode_params(output_encoder):
+    """
+    OutputEncoder 的参数换成 cv2.imencode 的参数，return: (扩展名, 参数列表)
+    WEBP 的 method 在 OpenCV 里不可调，lossless 用 quality>100 表示
+    """
+    fmt = output_encoder.format
+    if fmt == "PNG":
+        return ".png", [cv2.IMWRITE_PNG_COMPRESSION, output_encoder.png_compress_level]
+    if fmt == "JPEG":
+        return ".jpg", [cv2.IMWRITE_JPEG_QUALITY, output_encoder.jpeg_quality,
+                        cv2.IMWRITE_JPEG_OPTIMIZE, int(output_encoder.jpeg_optimize)]
+    quality = 101 if output_encoder.webp_lossless else output_encoder.webp_quality
+    return ".webp", [cv2.IMWRITE_WEBP_QUALITY, quality]
+
+
+def _blend_pil(dst, color, alpha):
+    """
+    与 PIL paste(带 alpha 蒙版)相同的整数混合公式，结果原地写入 dst
+    """
+    a = alpha.astype(np.uint32)[:, :, None]
+    tmp = dst.astype(np.uint32) * (255 - a) + color.astype(np.uint32) * a + 128
+    dst[...] = ((tmp >> 8) + tmp) >> 8
+
+
+class CvNewspaperCompositor(NewspaperCompositor):
+    """
+    ndarray 版的合成器，模板热更新、文字层缓存、输出编码设置都沿用 NewspaperCompositor
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._base_lock = threading.Lock()
+        # (日期, 天气, 字体, 模板路径, 模板 mtime) -> BGR 底图
+        self._base_cache = OrderedDict()
+
+    def _get_base(self, date_str, weather_str):
+        """
+        取“模板 + 文字层”的 BGR 底图(只读)，return: (底图, 文字层, 文字层位置, 版面)
+        """
+        header, header_pos = self.get_header_layer(date_str, weather_str)
+        with self._lock:
+            self._reload_if_changed()
+            pixels, layout = self._template_array(), self.layout
+            key = (date_str, weather_str, self.font_path, self.font_size, self._loaded_path, self._template_mtime)
+        with self._base_lock:
+            base = self._base_cache.get(key)
+            if base is not None:
+                self._base_cache.move_to_end(key)
+                return base, header, header_pos, layout
+
+        base = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+        # 文字层按 PIL paste 的公式混合，和 PIL 路径的像素完全一致
+        self._blend_header(base, header, header_pos, (0, 0, base.shape[1], base.shape[0]))
+        base.flags.writeable = False
+        with self._base_lock:
+            self._base_cache[key] = base
+            self._base_cache.move_to_end(key)
+            while len(self._base_cache) > BASE_CACHE_SIZE:
+                self._base_cache.popitem(last=False)
+        return base, header, header_pos, layout
+
+    @staticmethod
+    def _blend_header(canvas, header, header_pos, rect):
+        """
+        把文字层落在 rect(x0, y0, x1, y1) 里的部分混合到 BGR 画布上
+        """
+        hx, hy = header_pos
+        x0, y0 = max(hx, rect[0]), max(hy, rect[1])
+        x1 = min(hx + header.width, rect[2])
+        y1 = min(hy + header.height, rect[3])
+        if x0 >= x1 or y0 >= y1:
+            return
+        rgba = np.asarray(header.crop((x0 - hx, y0 - hy, x1 - hx, y1 - hy)))
+        _blend_pil(canvas[y0:y1, x0:x1], rgba[:, :, 2::-1], rgba[:, :, 3])
+
+    def decode_photo(self, photo):
+        """
+        解码成 BGR ndarray，结果可以直接传给 render / render_array
+        """
+        return load_photo_bgr(photo)
+
+    @metrics.timed("newspaper_render")
+    def render_array(self, photo, weather_str, now_date=None):
+        """
+        合成报纸图片，返回 BGR ndarray(新数组，调用方可以随意修改)
+        """
+        base, header, header_pos, layout = self._get_base(format_date_str(now_date), weather_str)
+        canvas = base.copy()
+        x, y = layout.photo_pos
+        w, h = layout.photo_size
+        # 直接缩放进画布的照片区域，不产生中间图
+        cv2.resize(load_photo_bgr(photo), (w, h), dst=canvas[y:y + h, x:x + w], interpolation=cv2.INTER_AREA)
+        # 文字层和照片区域重叠时(自定义模板)，把重叠部分的文字再画到照片上面，保持和 PIL 路径相同的叠放顺序
+        self._blend_header(canvas, header, header_pos, (x, y, x + w, y + h))
+        return canvas
+
+    def render(self, photo, weather_str, now_date=None):
+        """
+        合成报纸图片，返回 PIL Image，和 NewspaperCompositor.render 兼容
+        """
+        canvas = self.render_array(photo, weather_str, now_date=now_date)
+        return Image.fromarray(cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB))
+
+    def encode(self, canvas, output_encoder=None):
+        """
+        用 cv2.imencode 按 output_encoder(默认 self.output_encoder)的设置编码 BGR 数组，返回字节
+        """
+        ext, params = imencode_params(output_encoder or self.output_encoder)
+        ok, buf = cv2.imencode(ext, canvas, params)
+        if not ok:
+            raise RuntimeError(f"编码 {ext} 失败")
+        return buf.tobytes()
+
+    def render_bytes(self, photo, weather_str, now_date=None, output_encoder=None):
+        """
+        合成并编码，返回图片字节，全程不经过 PIL
+        """
+        canvas = self.render_array(photo, weather_str, now_date=now_date)
+        with metrics.timer("newspaper_encode"):
+            return self.encode(canvas, output_encoder)
+
+    def render_to_file(self, photo, weather_str, output_path, now_date=None):
+        """
+        合成并保存，全程不经过 PIL；compose / compose_async 都走这里
+        """
+        canvas = self.render_array(photo, weather_str, now_date=now_date)
+        with metrics.timer("newspaper_encode"):
+            write_bytes_atomic(self.encode(canvas), output_path)
+        return output_path
@@ -0,0 +1,207 @@
+# face_crop.py
+"""
+以人脸为中心的自动裁剪：
+  - 后台线程定期取采集线程的最新帧，缩小到 DETECT_WIDTH 宽的灰度图上做人脸检测
+    (OpenCV 自带的 Haar 级联，进程内只加载一次)
+  - 裁剪框用归一化坐标(0~1)表示并做指数平滑，不会随检测结果抖动
+  - 拍照时直接把当前裁剪框套到全分辨率帧上(切片，不拷贝)，拍照不增加任何检测耗时
+裁剪框的宽高比与模板照片区域一致，合成时不再变形。
+找不到级联文件或画面里没有人脸时，退回到画面正中的裁剪框。
+"""
+import os
+import threading
+import time
+
+import cv2
+
+import metrics
+from image_utils import PHOTO_SIZE
+
+FACE_CASCADE_FILE = "haarcascade_frontalface_default.xml"
+# 检测用的小图宽度，越小越快
+DETECT_WIDTH = 160
+# 两次检测的间隔(秒)
+DETECT_INTERVAL = 0.2
+# 指数平滑系数：每次检测后裁剪框向目标移动的比例
+SMOOTHING = 0.3
+# 丢失人脸后保持原裁剪框的时间(秒)，之后慢慢回到画面中心
+FACE_HOLD_SECONDS = 1.5
+# 裁剪框高度是人脸高度的多少倍(人脸在照片里的大小)
+FACE_CROP_SCALE = 3.5
+# 裁剪框至少占画面高度的比例，避免放大过度导致打印模糊
+MIN_CROP_FRACTION = 0.6
+# 人脸中心放在裁剪框从上往下的这个位置，留出头顶空间并带上肩膀
+FACE_VERTICAL_POS = 0.4
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def load_face_cascade(path=None):
+    """
+    加载人脸级联分类器(进程内只加载一次)，加载失败返回 None
+    """
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                if path is None:
+                    data_dir = getattr(getattr(cv2, "data", None), "haarcascades", "")
+                    path = os.path.join(data_dir, FACE_CASCADE_FILE)
+                cascade = cv2.CascadeClassifier(path) if os.path.exists(path) else None
+                if cascade is None or cascade.empty():
+                    print(f"未找到人脸级联文件 {path}，使用画面中心裁剪")
+                    cascade = False
+                _cascade = cascade
+    return _cascade or None
+
+
+def center_box(frame_w, frame_h, aspect, fraction=1.0):
+    """
+    画面正中、宽高比为 aspect 的最大裁剪框(再按 fraction 缩小)，归一化坐标 (x0, y0, x1, y1)
+    """
+    h = min(1.0, frame_w / (aspect * frame_h)) * fraction
+    w = h * aspect * frame_h / frame_w
+    return ((1 - w) / 2, (1 - h) / 2, (1 + w) / 2, (1 + h) / 2)
+
+
+def face_box(face, frame_w, frame_h, aspect):
+    """
+    由人脸矩形(检测图上的像素坐标已换算为归一化 (x, y, w, h))计算目标裁剪框，归一化坐标
+    """
+    fx, fy, fw, fh = face
+    max_h = min(1.0, frame_w / (aspect * frame_h))
+    h = min(max_h, max(MIN_CROP_FRACTION * max_h, fh * FACE_CROP_SCALE))
+    w = h * aspect * frame_h / frame_w
+    cx = fx + fw / 2
+    cy = fy + fh / 2
+    x0 = min(max(cx - w / 2, 0.0), 1.0 - w)
+    y0 = min(max(cy - h * FACE_VERTICAL_POS, 0.0), 1.0 - h)
+    return (x0, y0, x0 + w, y0 + h)
+
+
+class FaceCropTracker:
+    """
+    跟踪人脸并维护平滑后的裁剪框：
+        tracker = FaceCropTracker()
+        tracker.start(camera)          # camera 需提供 read_latest()，见 CameraCapture
+        crop = tracker.crop(frame)     # 拍照时调用，返回全分辨率帧上的切片
+    aspect: 裁剪框宽高比，默认与默认版面的照片区域一致(换模板时传 layout.photo_aspect)
+    """
+
+    def __init__(self, aspect=None, detect_width=DETECT_WIDTH, interval=DETECT_INTERVAL,
+                 smoothing=SMOOTHING, cascade_path=None):
+        self.aspect = aspect or PHOTO_SIZE[0] / PHOTO_SIZE[1]
+        self.detect_width = detect_width
+        self.interval = interval
+        self.smoothing = smoothing
+        self.cascade = load_face_cascade(cascade_path)
+        self._lock = threading.Lock()
+        # 归一化裁剪框，依赖画面宽高比，第一次检测前为 None
+        self._box = None
+        self._frame_size = None
+        self._last_face_time = None
+        self._running = False
+        self._thread = None
+        self._camera = None
+        self.detections = 0
+
+    # ---------- 后台检测 ----------
+
+    def start(self, camera):
+        if self._running:
+            return
+        self._camera = camera
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="face-crop", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        last_seq = None
+        while self._running:
+            frame, seq = self._camera.read_latest()
+            if frame is not None and seq != last_seq:
+                last_seq = seq
+                try:
+                    self.update(frame)
+                except Exception as e:
+                    print("人脸检测异常:", e)
+            time.sleep(self.interval)
+
+    def _detect(self, frame):
+        """
+        在缩小后的灰度图上检测，返回最大的人脸(归一化 x, y, w, h)，没有返回 None
+        """
+        frame_h, frame_w = frame.shape[:2]
+        scale = self.detect_width / frame_w
+        small = cv2.resize(frame, (self.detect_width, max(1, round(frame_h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        gray = cv2.equalizeHist(gray)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4, minSize=(16, 16))
+        if len(faces) == 0:
+            return None
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        small_h, small_w = gray.shape
+        return (x / small_w, y / small_h, w / small_w, h / small_h)
+
+    def update(self, frame):
+        """
+        对一帧做检测并更新平滑后的裁剪框(后台线程调用，也可以直接同步调用)
+        """
+        frame_h, frame_w = frame.shape[:2]
+        face = None
+        if self.cascade is not None:
+            with metrics.timer("face_detect"):
+                face = self._detect(frame)
+            metrics.inc("face_detect", result="face" if face is not None else "none")
+        now = time.monotonic()
+        with self._lock:
+            self.detections += 1
+            if self._frame_size != (frame_w, frame_h):
+                # 分辨率变了，归一化坐标对应的宽高比也变了，从中心重新开始
+                self._frame_size = (frame_w, frame_h)
+                self._box = center_box(frame_w, frame_h, self.aspect)
+            if face is not None:
+                self._last_face_time = now
+                target = face_box(face, frame_w, frame_h, self.aspect)
+            elif self._last_face_time is not None and now - self._last_face_time < FACE_HOLD_SECONDS:
+                return
+            else:
+                target = center_box(frame_w, frame_h, self.aspect)
+            a = self.smoothing
+            self._box = tuple(old + (new - old) * a for old, new in zip(self._box, target))
+
+    # ---------- 拍照时使用 ----------
+
+    def crop_box(self, frame_w, frame_h):
+        """
+        当前裁剪框在 frame_w x frame_h 画面上的像素坐标 (x0, y0, x1, y1)，宽高比严格为 aspect
+        """
+        with self._lock:
+            box = self._box if self._frame_size is not None else None
+            same_aspect = self._frame_size is not None and \
+                self._frame_size[0] * frame_h == self._frame_size[1] * frame_w
+        if box is None or not same_aspect:
+            box = center_box(frame_w, frame_h, self.aspect)
+        x0, y0, x1, y1 = box
+        h = round((y1 - y0) * frame_h)
+        w = min(frame_w, round(h * self.aspect))
+        h = min(frame_h, round(w / self.aspect))
+        left = min(max(round(x0 * frame_w), 0), frame_w - w)
+        top = min(max(round(y0 * frame_h), 0), frame_h - h)
+        return left, top, left + w, top + h
+
+    def crop(self, frame):
+        """
+        按当前裁剪框裁剪(全分辨率)帧，返回切片视图，不拷贝像素
+        """
+        frame_h, frame_w = frame.shape[:2]
+        x0, y0, x1, y1 = self.crop_box(frame_w, frame_h)
+        return frame[y0:y1, x0:x1]
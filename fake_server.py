@@ -1,16 +1,151 @@
 # fake_server.py
 import time
-# import threading
+import threading
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 
+import server_utils
+
 app = Flask(__name__)
 
-# 暂时用一个全局字典来缓存订单状态
-# orders[out_trade_no] = {
-#   "data": {...下单是请求JSON...}
-#   "status": "NOTPAY"
-# }
-orders = {}
+# 未支付订单多久后自动关闭(秒)，以及最多缓存多少个订单
+ORDER_TIMEOUT = 30 * 60
+MAX_ORDERS = 100000
+# 不会再变化的订单状态，容量满时优先淘汰
+FINISHED_STATES = ("SUCCESS", "CLOSED")
+
+
+class OrderStore:
+    """
+    线程安全、有上限的订单缓存，Flask 请求线程和后台线程都可以放心调用：
+      - 按订单号 O(1) 查找
+      - NOTPAY 订单超过 timeout 秒自动变为 CLOSED
+      - 超过 max_size 时先淘汰最早结束(SUCCESS/CLOSED)的订单，实在没有再淘汰最早的订单
+    每个订单: {"data": 下单请求JSON, "status": "NOTPAY", "created": ..., "expire_at": ..., "success_time": ...}
+    """
+
+    def __init__(self, timeout=ORDER_TIMEOUT, max_size=MAX_ORDERS):
+        self.timeout = timeout
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # 所有订单，按下单顺序
+        self._orders = OrderedDict()
+        # 还是 NOTPAY 的订单，按下单顺序(超时时间相同，所以也是按到期顺序)
+        self._pending = OrderedDict()
+        # 已结束的订单，按结束顺序，容量满时从头部淘汰
+        self._finished = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def _finish(self, out_trade_no, order, status):
+        order["status"] = status
+        self._pending.pop(out_trade_no, None)
+        self._finished[out_trade_no] = None
+        self._finished.move_to_end(out_trade_no)
+
+    def _expire(self, now):
+        """
+        把已到期的 NOTPAY 订单置为 CLOSED，只看队头，均摊 O(1)
+        """
+        while self._pending:
+            out_trade_no = next(iter(self._pending))
+            order = self._orders[out_trade_no]
+            if order["expire_at"] > now:
+                break
+            self._finish(out_trade_no, order, "CLOSED")
+            self.expired += 1
+
+    def _evict(self):
+        while len(self._orders) > self.max_size:
+            if self._finished:
+                out_trade_no, _ = self._finished.popitem(last=False)
+            else:
+                out_trade_no = next(iter(self._orders))
+                self._pending.pop(out_trade_no, None)
+            self._orders.pop(out_trade_no, None)
+            self.evicted += 1
+
+    def create(self, out_trade_no, data):
+        """
+        新建(或覆盖)一个 NOTPAY 订单
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._finished.pop(out_trade_no, None)
+            self._orders[out_trade_no] = {
+                "data": data,
+                "status": "NOTPAY",
+                "created": now,
+                "expire_at": now + self.timeout,
+                "success_time": None,
+            }
+            self._orders.move_to_end(out_trade_no)
+            self._pending[out_trade_no] = None
+            self._pending.move_to_end(out_trade_no)
+            self._evict()
+
+    def get(self, out_trade_no):
+        """
+        返回订单的副本，不存在返回 None
+        """
+        with self._lock:
+            self._expire(time.time())
+            order = self._orders.get(out_trade_no)
+            return None if order is None else dict(order)
+
+    def set_status(self, out_trade_no, status, allowed_from=None):
+        """
+        修改订单状态。allowed_from 不为空时，只有当前状态在其中才修改。
+        return: (是否修改成功, 修改前的状态)，订单不存在时状态为 None
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            order = self._orders.get(out_trade_no)
+            if order is None:
+                return False, None
+            old_status = order["status"]
+            if allowed_from is not None and old_status not in allowed_from:
+                return False, old_status
+            if status == "SUCCESS":
+                order["success_time"] = now
+            if status in FINISHED_STATES:
+                self._finish(out_trade_no, order, status)
+            else:
+                order["status"] = status
+            return True, old_status
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "orders": len(self._orders),
+                "pending": len(self._pending),
+                "finished": len(self._finished),
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max_size": self.max_size,
+                "timeout": self.timeout,
+            }
+
+    def __contains__(self, out_trade_no):
+        return self.get(out_trade_no) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._orders)
+
+
+orders = OrderStore()
+
+# 模拟网络往返延迟(秒)，压测时用来贴近真实的微信支付接口
+MOCK_LATENCY = 0.0
+
+@app.before_request
+def simulate_latency():
+    if MOCK_LATENCY > 0:
+        time.sleep(MOCK_LATENCY)
 
 def auto_set_success(out_trade_no, delay=0):
     """
@@ -18,9 +153,9 @@ def auto_set_success(out_trade_no, delay=0):
     等待 delay 秒后把订单状态设置为 SUCCESS
     """
     time.sleep(delay)
-    if out_trade_no in orders and orders[out_trade_no]["status"] != "SUCCESS":
+    ok, _ = orders.set_status(out_trade_no, "SUCCESS", allowed_from=("NOTPAY", "USERPAYING"))
+    if ok:
         print(f"[MockServer] 订单 {out_trade_no} 订单模拟成功支付")
-        orders[out_trade_no]["status"] = "SUCCESS"
 
 @app.route("/v3/pay/transactions/native", methods=["POST"])
 def mock_unified_order():
@@ -38,7 +173,7 @@ def mock_unified_order():
         return jsonify({"error": "missing out_trade_no"}), 400
     
     # 缓存订单信息
-    orders[out_trade_no] = {"data": body, "status": "NOTPAY"}
+    orders.create(out_trade_no, body)
     print(f"[MockServer] 收到订单请求 out_trade_no={out_trade_no}, 订单已缓存 status=NOTPAY")
 
     # 返回一个模拟的code_url
@@ -54,10 +189,10 @@ def mock_query_order(out_trade_no):
     GET /v3/pay/transactions/out-trade-no/<out_trade_no>?mchid=xxxx
     """
     mchid = request.args.get("mchid", None)
-    if out_trade_no not in orders:
+    order_info = orders.get(out_trade_no)
+    if order_info is None:
         return jsonify({"error": "order not found"}), 404
-    
-    order_info = orders[out_trade_no]
+
     status = order_info["status"]
     # 构造响应
     resp = {
@@ -69,10 +204,23 @@ def mock_query_order(out_trade_no):
         "success_time": None
     }
     if status == "SUCCESS":
-        resp["success_time"] = time.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+        resp["success_time"] = time.strftime("%Y-%m-%dT%H:%M:%S+08:00", time.localtime(order_info["success_time"]))
     
     return jsonify(resp), 200
 
+@app.route("/v3/pay/transactions/out-trade-no/<out_trade_no>/close", methods=["POST"])
+def mock_close_order(out_trade_no):
+    """
+    模拟关闭订单：未支付的订单置为 CLOSED，成功返回 204 无内容
+    """
+    ok, old_status = orders.set_status(out_trade_no, "CLOSED", allowed_from=("NOTPAY", "USERPAYING", "CLOSED"))
+    if old_status is None:
+        return jsonify({"error": "order not found"}), 404
+    if not ok:
+        return jsonify({"code": "ORDERPAID", "message": "订单已支付"}), 400
+    print(f"[MockServer] 订单 {out_trade_no} 已关闭")
+    return "", 204
+
 # 可选: 人工模拟支付成功
 @app.route("/fakepay/<out_trade_no>", methods=["POST"])
 def mock_pay_success(out_trade_no):
@@ -81,12 +229,19 @@ def mock_pay_success(out_trade_no):
       curl -X POST http://127.0.0.1:8000/fakepay/xxx
     把订单状态变成 SUCCESS
     """
-    if out_trade_no not in orders:
+    ok, old_status = orders.set_status(out_trade_no, "SUCCESS", allowed_from=("NOTPAY", "USERPAYING", "SUCCESS"))
+    if old_status is None:
         return jsonify({"error": "order not found"}), 404
-    orders[out_trade_no]["status"] = "SUCCESS"
+    if not ok:
+        return jsonify({"code": "ORDERCLOSED", "message": "订单已关闭"}), 400
     print(f"[MockServer] 手动将订单 {out_trade_no} 状态置为 SUCCESS")
     return jsonify({"message": "ok"}), 200
 
+# 查看订单缓存的占用情况(长时间压测时观察内存是否稳定)
+@app.route("/fakeserver/stats", methods=["GET"])
+def mock_stats():
+    return jsonify(orders.stats()), 200
+
 
 # @app.route("/wxpay/callback", methods=["POST"])
 # def wxpay_callback():
@@ -105,6 +260,38 @@ def mock_pay_success(out_trade_no):
 #     # 返回成功
 #     return jsonify({"code": "SUCCESS", "message": "成功"})
 
+def start_in_thread(host="127.0.0.1", port=8000):
+    """
+    在当前进程的后台线程里启动 mock server(压测、基准测试用)，
+    返回 werkzeug server，用完调用 server.shutdown()
+    """
+    return server_utils.start_in_thread(app, host, port, name="fake-server")
+
+def spawn_process(host="127.0.0.1", port=8000, latency_ms=0, wait=10.0):
+    """
+    以独立进程启动 mock server(不和压测客户端抢 GIL)，端口可连接后返回 Popen，用完调用 proc.terminate()
+    """
+    return server_utils.spawn_process("fake_server.py", host, port, latency_ms, wait)
+
 if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="微信支付 V3 mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求额外等待的毫秒数")
+    parser.add_argument("--quiet", action="store_true", help="关闭 debug 模式和请求日志(压测用)")
+    parser.add_argument("--order-timeout", type=float, default=ORDER_TIMEOUT, help="未支付订单自动关闭的秒数")
+    parser.add_argument("--max-orders", type=int, default=MAX_ORDERS, help="最多缓存的订单数")
+    args = parser.parse_args()
+    MOCK_LATENCY = args.latency_ms / 1000
+    orders.timeout = args.order_timeout
+    orders.max_size = args.max_orders
+
     # 本地跑
-    app.run(host="127.0.0.1", port=8000, debug=True)
+    if args.quiet:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
@@ -0,0 +1,102 @@
+# fake_weather_server.py
+import random
+import threading
+import time
+from datetime import datetime
+from flask import Flask, request, jsonify
+
+import server_utils
+
+app = Flask(__name__)
+
+# 模拟网络往返延迟(秒)，压测时用来贴近真实的高德接口
+MOCK_LATENCY = 0.0
+WEATHER_CHOICES = ["晴", "多云", "阴", "小雨", "霾"]
+
+# 统计每个城市被请求的次数，方便确认缓存/合并是否生效
+request_counts = {}
+request_counts_lock = threading.Lock()
+
+@app.before_request
+def simulate_latency():
+    if MOCK_LATENCY > 0:
+        time.sleep(MOCK_LATENCY)
+
+@app.route("/v3/weather/weatherInfo", methods=["GET"])
+def mock_weather_info():
+    """
+    模拟高德实况天气接口：
+    GET /v3/weather/weatherInfo?city=<adcode>&key=xxx
+    返回格式与 resource/weather_result.json 相同，reporttime 为当前时间
+    """
+    city = request.args.get("city")
+    key = request.args.get("key")
+    if not key:
+        return jsonify({"status": "0", "info": "INVALID_USER_KEY", "infocode": "10001"}), 200
+    if not city or not city.isdigit():
+        return jsonify({"status": "0", "info": "INVALID_PARAMS", "infocode": "20000"}), 200
+    with request_counts_lock:
+        request_counts[city] = request_counts.get(city, 0) + 1
+
+    # 同一城市同一小时内天气保持一致
+    rnd = random.Random(f"{city}-{datetime.now():%Y%m%d%H}")
+    temperature = rnd.randint(-5, 30)
+    humidity = rnd.randint(20, 90)
+    resp = {
+        "status": "1",
+        "count": "1",
+        "info": "OK",
+        "infocode": "10000",
+        "lives": [
+            {
+                "province": "模拟省",
+                "city": f"模拟区{city}",
+                "adcode": city,
+                "weather": rnd.choice(WEATHER_CHOICES),
+                "temperature": str(temperature),
+                "winddirection": "西北",
+                "windpower": "4",
+                "humidity": str(humidity),
+                "reporttime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "temperature_float": f"{temperature}.0",
+                "humidity_float": f"{humidity}.0",
+            }
+        ],
+    }
+    return jsonify(resp), 200
+
+@app.route("/fakeweather/stats", methods=["GET"])
+def mock_stats():
+    with request_counts_lock:
+        return jsonify(dict(request_counts)), 200
+
+def start_in_thread(host="127.0.0.1", port=8001):
+    """
+    在当前进程的后台线程里启动 mock 天气服务，返回 werkzeug server，用完调用 server.shutdown()
+    """
+    return server_utils.start_in_thread(app, host, port, name="fake-weather-server")
+
+def spawn_process(host="127.0.0.1", port=8001, latency_ms=0, wait=10.0):
+    """
+    以独立进程启动 mock 天气服务，见 server_utils.spawn_process
+    """
+    return server_utils.spawn_process("fake_weather_server.py", host, port, latency_ms, wait)
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="高德天气接口 mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求额外等待的毫秒数")
+    parser.add_argument("--quiet", action="store_true", help="关闭 debug 模式和请求日志(压测用)")
+    args = parser.parse_args()
+    MOCK_LATENCY = args.latency_ms / 1000
+
+    # 本地跑，配合 WeatherCache(api_url="http://127.0.0.1:8001/v3/weather/weatherInfo")
+    if args.quiet:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
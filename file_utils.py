@@ -0,0 +1,56 @@
+# file_utils.py
+"""
+原子写文件：先写到目标文件同目录的临时文件，写完再 os.replace 覆盖目标文件，
+其他进程(打印、上传、读天气缓存)不会读到写了一半的文件。
+
+    with atomic_write("a.json", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+需要边生成边写的(如逐条编码的 PNG)直接用 AtomicFile，最后 commit() 或 abort()。
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+class AtomicFile:
+    """
+    打开一个临时文件(self.file)，commit() 时原子地替换 path，abort() 时丢弃
+    """
+
+    def __init__(self, path, mode="wb", encoding=None):
+        self.path = path
+        out_dir = os.path.dirname(os.path.abspath(path))
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(path)[1], dir=out_dir)
+        self.file = os.fdopen(fd, mode, encoding=encoding)
+
+    def commit(self):
+        try:
+            self.file.close()
+            # mkstemp 默认权限是 0600，改成普通文件的权限，覆盖时沿用原文件权限
+            mode = os.stat(self.path).st_mode & 0o777 if os.path.exists(self.path) else 0o644
+            os.chmod(self.tmp_path, mode)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        return self.path
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    """
+    with 块里写临时文件，正常结束时替换 path，出异常时删除临时文件、目标文件保持不变
+    """
+    atomic = AtomicFile(path, mode, encoding)
+    try:
+        yield atomic.file
+    except BaseException:
+        atomic.abort()
+        raise
+    atomic.commit()
@@ -1,39 +1,568 @@
 from PIL import Image
+import io
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from PIL import ImageDraw, ImageFont
 
+import metrics
+from file_utils import atomic_write
+
 TEMPLATE_PATH = "resource/newspaper_template.png"
+# template_pack.py 编译出的模板包(JSON + 原始像素)放在这里
+TEMPLATE_PACK_DIR = "resource/templates"
 FONT_PATH = "resource/msyh.ttc"  # 如果有别的路径，请自行改写
+FONT_SIZE = 15
+
+# 模板中用户照片的大小和粘贴位置 (需根据模板实际情况设置)
+PHOTO_SIZE = (448, 336)
+PHOTO_POS = (210, 250)  # 假定 (210,250)
+
+# 顶部文字条：位置 + 固定的大标题
+DATE_TEXT_POS = (5, 5)
+WEATHER_TEXT_POS = (300, 5)
+HEADLINE_TEXT_POS = (600, 5)
+HEADLINE_TEXT = "今日新闻,你登报了！"
+TEXT_COLOR = (0, 0, 0)
+# 文字层缓存的条目数，(日期, 天气) 一天最多变化几十次
+HEADER_CACHE_SIZE = 32
+# 合成后端："pil" 为 NewspaperCompositor；"cv" 为 cv_compositor.CvNewspaperCompositor(ndarray 全程处理)
+COMPOSITOR_BACKEND = "pil"
+COMPOSITOR_BACKENDS = ("pil", "cv")
 
-def create_newspaper_image(photo_path, weather_str, output_path="final_newspaper.png"):
+
+class TemplateLayout:
     """
-    合成最终的报纸图片
+    模板的版面：照片框、各段文字的位置和内容、字体。
+    文字内容里的 {date} / {weather} 在合成时替换。
+    默认值就是下面这些坐标常量，模板包(template_pack.py)里可以各自覆盖
     """
-    template = Image.open(TEMPLATE_PATH).convert("RGB")
-    draw = ImageDraw.Draw(template)
-    user_photo = Image.open(photo_path).convert("RGB")
 
-    # 根据模板中用户照片需要的大小进行 resize
-    user_photo = user_photo.resize((448, 336))
+    def __init__(self, photo_pos=PHOTO_POS, photo_size=PHOTO_SIZE, texts=None, font_path=FONT_PATH,
+                 font_size=FONT_SIZE, text_color=TEXT_COLOR):
+        self.photo_pos = tuple(photo_pos)
+        self.photo_size = tuple(photo_size)
+        if texts is None:
+            texts = [
+                (DATE_TEXT_POS, "今日日期：{date}"),
+                (WEATHER_TEXT_POS, "今日天气：{weather}"),
+                (HEADLINE_TEXT_POS, HEADLINE_TEXT),
+            ]
+        self.texts = [(tuple(pos), text) for pos, text in texts]
+        self.font_path = font_path
+        self.font_size = font_size
+        self.text_color = tuple(text_color)
 
-    # 将照片粘贴到模板上的指定位置 (需根据模板实际情况设置)
-    template.paste(user_photo, (210, 250))  # 假定 (210,250)
+    @property
+    def photo_aspect(self):
+        return self.photo_size[0] / self.photo_size[1]
 
-    # 设置字体
-    if FONT_PATH and os.path.exists(FONT_PATH):
-        font = ImageFont.truetype(FONT_PATH, 15)
-    else:
-        font = ImageFont.load_default()
+    def format_texts(self, date_str, weather_str):
+        """
+        return: [((x, y), 文字)]
+        """
+        return [(pos, text.format(date=date_str, weather=weather_str)) for pos, text in self.texts]
+
+    def to_dict(self):
+        return {
+            "photo_slot": {"x": self.photo_pos[0], "y": self.photo_pos[1],
+                           "width": self.photo_size[0], "height": self.photo_size[1]},
+            "texts": [{"pos": list(pos), "text": text} for pos, text in self.texts],
+            "font": {"path": self.font_path, "size": self.font_size},
+            "text_color": list(self.text_color),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        slot = data["photo_slot"]
+        font = data.get("font", {})
+        return cls(
+            photo_pos=(slot["x"], slot["y"]),
+            photo_size=(slot["width"], slot["height"]),
+            texts=[(t["pos"], t["text"]) for t in data["texts"]] if "texts" in data else None,
+            font_path=font.get("path", FONT_PATH),
+            font_size=font.get("size", FONT_SIZE),
+            text_color=data.get("text_color", TEXT_COLOR),
+        )
+
+
+def format_date_str(now_date=None):
+    """
+    年月日手动组装，如 “2025年3月5日”
+    """
+    if now_date is None:
+        now_date = datetime.now()
+    return f"{now_date.year}年{now_date.month}月{now_date.day}日"
 
-    now_date = datetime.now()
-    date_str = f"{now_date.year}年{now_date.month}月{now_date.day}日"
 
-    # 左上角写日期和天气等文字
-    draw.text((5, 5), f"今日日期：{date_str}", font=font, fill=(0, 0, 0))
-    draw.text((300, 5), f"今日天气：{weather_str}", font=font, fill=(0, 0, 0))
-    draw.text((600, 5), "今日新闻,你登报了！", font=font, fill=(0, 0, 0))
+def save_image_atomic(image, output_path, **save_kwargs):
+    """
+    先写到同目录的临时文件，再 os.replace 覆盖目标文件，
+    避免其他进程(打印、上传)读到写了一半的图片
+    """
+    fmt = save_kwargs.pop("format", None) or Image.registered_extensions().get(
+        os.path.splitext(output_path)[1].lower(), "PNG")
+    with atomic_write(output_path) as f:
+        image.save(f, format=fmt, **save_kwargs)
+    return output_path
 
-    template.save(output_path)
-    print(f"报纸图片已生成：{output_path}")
+
+def write_bytes_atomic(data, output_path):
+    """
+    已经编码好的图片字节，同 save_image_atomic 的方式原子地写入
+    """
+    with atomic_write(output_path) as f:
+        f.write(data)
     return output_path
+
+
+class OutputEncoder:
+    """
+    输出图片的编码参数，按部署需要在文件大小和编码耗时之间取舍：
+      - PNG: compress_level 0(最快、最大) ~ 9(最慢、最小)，Pillow 默认 6
+      - JPEG: quality + optimize(优化哈夫曼表)
+      - WEBP: quality + method 0(最快) ~ 6(最小)，lossless 可选
+    """
+
+    EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+
+    def __init__(self, format="PNG", png_compress_level=6, jpeg_quality=90,
+                 jpeg_optimize=True, webp_quality=85, webp_method=4, webp_lossless=False):
+        format = format.upper()
+        if format == "JPG":
+            format = "JPEG"
+        if format not in self.EXTENSIONS:
+            raise ValueError(f"不支持的输出格式: {format}")
+        self.format = format
+        self.png_compress_level = png_compress_level
+        self.jpeg_quality = jpeg_quality
+        self.jpeg_optimize = jpeg_optimize
+        self.webp_quality = webp_quality
+        self.webp_method = webp_method
+        self.webp_lossless = webp_lossless
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS[self.format]
+
+    def save_kwargs(self):
+        if self.format == "PNG":
+            return {"format": "PNG", "compress_level": self.png_compress_level}
+        if self.format == "JPEG":
+            return {"format": "JPEG", "quality": self.jpeg_quality, "optimize": self.jpeg_optimize}
+        return {"format": "WEBP", "quality": self.webp_quality, "method": self.webp_method,
+                "lossless": self.webp_lossless}
+
+    def fix_extension(self, output_path):
+        """
+        输出路径的后缀和编码格式不一致时，换成对应的后缀
+        """
+        root, ext = os.path.splitext(output_path)
+        if Image.registered_extensions().get(ext.lower()) == self.format:
+            return output_path
+        return root + self.extension
+
+    def save(self, image, output_path):
+        """
+        按当前参数原子地保存图片
+        """
+        return save_image_atomic(image, output_path, **self.save_kwargs())
+
+    def __repr__(self):
+        return f"OutputEncoder({self.save_kwargs()!r})"
+
+
+# 常用预设，可直接传给 NewspaperCompositor(output_encoder=...)
+OUTPUT_PRESETS = {
+    "png": OutputEncoder("PNG"),
+    "png-fast": OutputEncoder("PNG", png_compress_level=1),
+    "jpeg": OutputEncoder("JPEG", jpeg_quality=90),
+    "webp": OutputEncoder("WEBP", webp_quality=85),
+}
+
+
+def load_photo(photo):
+    """
+    把各种形式的照片统一成 RGB 的 PIL Image：
+      - 文件路径(str / PathLike)，或已打开的文件对象(BytesIO、上传的文件等)
+      - PIL Image
+      - OpenCV 读出来的 BGR ndarray (HxWx3)，无需先写成 captured.jpg
+    """
+    if isinstance(photo, Image.Image):
+        return photo if photo.mode == "RGB" else photo.convert("RGB")
+    if isinstance(photo, (str, os.PathLike)) or hasattr(photo, "read"):
+        with Image.open(photo) as im:
+            return im.convert("RGB")
+    # 其余按 ndarray 处理(不在这里 import numpy，避免只用路径时的额外依赖)
+    if getattr(photo, "ndim", None) == 3 and photo.shape[2] >= 3:
+        # BGR -> RGB，去掉可能存在的 alpha 通道
+        return Image.fromarray(photo[:, :, 2::-1].copy(), "RGB")
+    if getattr(photo, "ndim", None) == 2:
+        return Image.fromarray(photo).convert("RGB")
+    raise TypeError(f"不支持的照片类型: {type(photo)!r}")
+
+
+class NewspaperCompositor:
+    """
+    常驻内存的报纸合成器：
+      - 模板图和字体只解码/加载一次，缓存在内存里
+      - 每次合成时复制缓存的模板，再贴照片、写文字
+      - 模板文件的 mtime 变化后自动重新加载
+      - 模板可以是 PNG，也可以是编译好的模板包(.json，见 template_pack.py)，
+        版面(照片框、文字坐标、字体)跟着模板走；switch_template() 可随时切换
+      - 输出编码可配置(OutputEncoder)，并可在后台线程保存
+    font_path / font_size 为空时使用模板版面里的字体
+    """
+
+    def __init__(self, template_path=TEMPLATE_PATH, font_path=None, font_size=None,
+                 output_encoder=None):
+        self.template_path = template_path
+        self._font_path = font_path
+        self._font_size = font_size
+        self.output_encoder = output_encoder or OUTPUT_PRESETS["png"]
+        self._lock = threading.Lock()
+        self._save_executor = None
+        # (日期, 天气, 字体, 缩放) -> (RGBA 文字层, 贴图位置)，LRU 淘汰，换模板时清空
+        self._header_cache = OrderedDict()
+        # PIL 模板；模板包在第一次用到时才生成(cv 后端只用 ndarray)
+        # _template_mtime 是模板文件的 mtime，PNG 模板为 (PNG mtime, 对应模板包元数据的 mtime)
+        self._template = None
+        self._pack = None
+        self._loaded_path = None
+        self._template_mtime = None
+        self._font = None
+        self.layout = TemplateLayout()
+
+    @property
+    def font_path(self):
+        return self._font_path or self.layout.font_path
+
+    @property
+    def font_size(self):
+        return self._font_size or self.layout.font_size
+
+    def _load_font(self, scale=1):
+        if self.font_path and os.path.exists(self.font_path):
+            return ImageFont.truetype(self.font_path, round(self.font_size * scale))
+        font = ImageFont.load_default()
+        if scale == 1 or not hasattr(font, "size"):
+            # 旧版 Pillow 的默认字体是固定大小的位图字体，无法放大
+            return font
+        return ImageFont.load_default(size=round(font.size * scale))
+
+    def _reload_if_changed(self):
+        """
+        检查模板文件的 mtime，首次调用、文件被替换或切换模板后重新加载(调用方持有锁)。
+        PNG 模板如果在 TEMPLATE_PACK_DIR 里有未过期的模板包，直接映射模板包，不再解码；
+        对应的模板包重新编译(PNG 没变，比如只改了照片框)也会重新加载
+        """
+        from template_pack import default_pack_path, find_compiled_pack, is_template_pack, load_template_pack
+
+        mtime = os.path.getmtime(self.template_path)
+        if not is_template_pack(self.template_path):
+            try:
+                mtime = (mtime, os.path.getmtime(default_pack_path(self.template_path)))
+            except OSError:
+                mtime = (mtime, None)
+        if self._loaded_path == self.template_path and mtime == self._template_mtime:
+            return
+
+        pack_path = self.template_path if is_template_pack(self.template_path) else \
+            find_compiled_pack(self.template_path)
+        if pack_path is not None:
+            self._pack = load_template_pack(pack_path)
+            self._template = None
+            self.layout = self._pack.layout
+        else:
+            with Image.open(self.template_path) as im:
+                template = im.convert("RGB")
+            template.load()
+            self._pack = None
+            self._template = template
+            self.layout = TemplateLayout()
+        self._loaded_path = self.template_path
+        self._template_mtime = mtime
+        self._font = self._load_font()
+        self._header_cache.clear()
+        print(f"报纸模板已加载：{pack_path or self.template_path}")
+
+    def _template_image(self):
+        """
+        当前模板的 PIL 图(调用方持有锁)
+        """
+        if self._template is None:
+            self._template = self._pack.image
+        return self._template
+
+    def switch_template(self, template_path):
+        """
+        切换模板(PNG 或模板包)，之后的合成立即使用新模板；模板包在进程内有缓存，切回来不用重新加载
+        """
+        with self._lock:
+            self.template_path = template_path
+            self._reload_if_changed()
+            return self.layout
+
+    def get_layout(self):
+        with self._lock:
+            self._reload_if_changed()
+            return self.layout
+
+    def get_template(self):
+        """
+        返回缓存的模板图(只读，不要直接在上面画)
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return self._template_image()
+
+    def get_template_array(self):
+        """
+        返回模板的 RGB ndarray(只读)；模板包直接返回内存映射，不拷贝
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return self._template_array()
+
+    def _template_array(self):
+        """
+        当前模板的 RGB ndarray(调用方持有锁)
+        """
+        import numpy as np
+
+        if self._pack is not None:
+            return self._pack.pixels
+        return np.asarray(self._template)
+
+    def get_font(self):
+        with self._lock:
+            self._reload_if_changed()
+            return self._font
+
+    def _rasterize_header(self, date_str, weather_str, font, scale=1, layout=None):
+        """
+        把版面里的几段文字(日期、天气、大标题)一次性画到一张透明的 RGBA 小图上，
+        只覆盖所有文字的外接矩形，返回 (文字层, 左上角位置)
+        scale: 打印用的放大倍数，文字位置按比例换算(字体由调用方按同样比例加载)
+        """
+        layout = layout or self.layout
+        texts = layout.format_texts(date_str, weather_str)
+        if scale != 1:
+            texts = [((round(x * scale), round(y * scale)), text) for (x, y), text in texts]
+        boxes = []
+        for (x, y), text in texts:
+            left, top, right, bottom = font.getbbox(text)
+            boxes.append((x + left, y + top, x + right, y + bottom))
+        x0 = min(b[0] for b in boxes)
+        y0 = min(b[1] for b in boxes)
+        x1 = max(b[2] for b in boxes)
+        y1 = max(b[3] for b in boxes)
+
+        layer = Image.new("RGBA", (max(x1 - x0, 1), max(y1 - y0, 1)), layout.text_color + (0,))
+        draw = ImageDraw.Draw(layer)
+        for (x, y), text in texts:
+            draw.text((x - x0, y - y0), text, font=font, fill=layout.text_color + (255,))
+        return layer, (x0, y0)
+
+    def get_header_layer(self, date_str, weather_str, scale=1):
+        """
+        取 (日期, 天气) 对应的文字层，没有就栅格化一次并放进 LRU 缓存
+        scale 不为 1 时(高分辨率打印)按比例放大字体和位置
+        """
+        with self._lock:
+            self._reload_if_changed()
+            font = self._font
+            layout = self.layout
+            key = (date_str, weather_str, self.font_path, self.font_size, scale)
+            cached = self._header_cache.get(key)
+            if cached is not None:
+                self._header_cache.move_to_end(key)
+                return cached
+        # 栅格化放在锁外，避免阻塞其他线程的渲染
+        if scale != 1:
+            font = self._load_font(scale)
+        cached = self._rasterize_header(date_str, weather_str, font, scale, layout)
+        with self._lock:
+            # 期间换了模板就不放进缓存
+            if layout is self.layout:
+                self._header_cache[key] = cached
+                self._header_cache.move_to_end(key)
+                while len(self._header_cache) > HEADER_CACHE_SIZE:
+                    self._header_cache.popitem(last=False)
+        return cached
+
+    def decode_photo(self, photo):
+        """
+        把照片解码成本后端合成时用的格式(这里是 RGB PIL Image)，结果可以直接传给 render
+        """
+        return load_photo(photo)
+
+    @metrics.timed("newspaper_render")
+    def render(self, photo, weather_str, now_date=None):
+        """
+        合成报纸图片，返回 PIL Image (不落盘)
+        photo: 照片路径 / PIL Image / BGR ndarray，见 load_photo
+        """
+        canvas, layout = self.new_canvas()
+        # 一次照片粘贴 + 一次缓存文字层的 alpha 贴图
+        self.paste_photo(canvas, photo, layout)
+        self.paste_header(canvas, format_date_str(now_date), weather_str)
+        return canvas
+
+    # render 的各个步骤，bench_compositor.py 分别计时
+
+    def new_canvas(self):
+        """
+        复制一份缓存的模板作为画布，return: (画布, 对应的版面)
+        """
+        with self._lock:
+            self._reload_if_changed()
+            return self._template_image().copy(), self.layout
+
+    def paste_photo(self, canvas, photo, layout):
+        """
+        根据模板中用户照片需要的大小进行 resize，贴到照片区域
+        """
+        canvas.paste(load_photo(photo).resize(layout.photo_size), layout.photo_pos)
+
+    def paste_header(self, canvas, date_str, weather_str):
+        """
+        把缓存的文字层(日期、天气、标题)贴到画布上
+        """
+        header, header_pos = self.get_header_layer(date_str, weather_str)
+        canvas.paste(header, header_pos, header)
+
+    def encode(self, image, output_encoder=None):
+        """
+        按 output_encoder(默认 self.output_encoder)编码，返回字节
+        """
+        buf = io.BytesIO()
+        image.save(buf, **(output_encoder or self.output_encoder).save_kwargs())
+        return buf.getvalue()
+
+    def render_to_file(self, photo, weather_str, output_path, now_date=None):
+        """
+        合成并按 output_encoder 保存到 output_path(不改后缀、不打印)，返回输出路径
+        """
+        newspaper = self.render(photo, weather_str, now_date=now_date)
+        with metrics.timer("newspaper_encode"):
+            self.output_encoder.save(newspaper, output_path)
+        return output_path
+
+    def render_bytes(self, photo, weather_str, now_date=None, output_encoder=None):
+        """
+        合成并编码，返回图片字节(不落盘，渲染服务用)；output_encoder 为空时用 self.output_encoder
+        """
+        newspaper = self.render(photo, weather_str, now_date=now_date)
+        with metrics.timer("newspaper_encode"):
+            return self.encode(newspaper, output_encoder)
+
+    def compose(self, photo, weather_str, output_path="final_newspaper.png", now_date=None):
+        """
+        合成并保存报纸图片，返回输出路径
+        """
+        output_path = self.output_encoder.fix_extension(output_path)
+        with metrics.timer("newspaper_compose"):
+            self.render_to_file(photo, weather_str, output_path, now_date=now_date)
+        print(f"报纸图片已生成：{output_path}")
+        return output_path
+
+    def compose_print(self, photo, weather_str, output_path="final_print.png", paper="A4", dpi=300,
+                      now_date=None):
+        """
+        按打印分辨率逐条渲染并保存为 PNG，内存占用与 DPI 无关，见 print_render.render_print
+        """
+        from print_render import render_print
+        return render_print(photo, weather_str, output_path, paper=paper, dpi=dpi, now_date=now_date,
+                            compositor=self)
+
+    def _get_save_executor(self):
+        with self._lock:
+            if self._save_executor is None:
+                # 单线程即可：保证保存顺序，且不和 Tk 主线程抢 CPU
+                self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="newspaper-save")
+            return self._save_executor
+
+    def save_async(self, image, output_path):
+        """
+        在后台线程编码并保存，立即返回 Future(结果为输出路径)
+        """
+        output_path = self.output_encoder.fix_extension(output_path)
+
+        def _save():
+            with metrics.timer("newspaper_encode"):
+                self.output_encoder.save(image, output_path)
+            print(f"报纸图片已生成：{output_path}")
+            return output_path
+
+        return self._get_save_executor().submit(_save)
+
+    def render_async(self, photo, weather_str, now_date=None):
+        """
+        只在后台线程合成，立即返回 Future(结果为 PIL Image，不落盘)，打印队列直接用它
+        """
+        return self._get_save_executor().submit(self.render, photo, weather_str, now_date)
+
+    def compose_async(self, photo, weather_str, output_path="final_newspaper.png", now_date=None):
+        """
+        合成 + 保存都放到后台线程，立即返回 Future(结果为输出路径)。
+        注意：photo 若是 ndarray，调用方在 Future 完成前不要再修改它
+        """
+        return self._get_save_executor().submit(self.compose, photo, weather_str, output_path, now_date)
+
+    def shutdown(self, wait=True):
+        """
+        关闭后台保存线程
+        """
+        with self._lock:
+            executor, self._save_executor = self._save_executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def create_compositor(backend=None, **kwargs):
+    """
+    按后端名创建合成器，backend 为空时用 COMPOSITOR_BACKEND；
+    kwargs 同 NewspaperCompositor 的参数
+    """
+    backend = backend or COMPOSITOR_BACKEND
+    if backend == "pil":
+        return NewspaperCompositor(**kwargs)
+    if backend == "cv":
+        # 用到时才导入，只用 PIL 后端时不依赖 numpy/OpenCV
+        from cv_compositor import CvNewspaperCompositor
+        return CvNewspaperCompositor(**kwargs)
+    raise ValueError(f"未知的合成后端: {backend}")
+
+
+_default_compositor = None
+_default_compositor_lock = threading.Lock()
+
+
+def get_compositor():
+    """
+    获取进程内共享的合成器(懒加载)，后端由 COMPOSITOR_BACKEND 决定
+    """
+    global _default_compositor
+    if _default_compositor is None:
+        with _default_compositor_lock:
+            if _default_compositor is None:
+                _default_compositor = create_compositor()
+    return _default_compositor
+
+
+def create_newspaper_image(photo, weather_str, output_path="final_newspaper.png"):
+    """
+    合成最终的报纸图片
+    photo 可以是照片路径，也可以直接传 PIL Image 或摄像头的 BGR 帧
+    """
+    return get_compositor().compose(photo, weather_str, output_path)
+
+
+def create_newspaper_image_async(photo, weather_str, output_path="final_newspaper.png"):
+    """
+    create_newspaper_image 的后台版本，返回 concurrent.futures.Future
+    """
+    return get_compositor().compose_async(photo, weather_str, output_path)
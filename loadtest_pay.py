@@ -0,0 +1,210 @@
+# loadtest_pay.py
+"""
+支付流程压测：启动本地 fake_server，用真实的 pay_v3 签名代码按固定速率和并发
+调用下单 / 查单接口(可选按比例调 /fakepay 模拟支付)，输出 JSON 结果便于对比历史数据：
+
+    python loadtest_pay.py --rate 50 --concurrency 16 --duration 30 --pay-ratio 0.5 -o result.json
+
+已有服务时可用 --host 指定，不再自动启动。
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import fake_server
+import pay_v3
+from bench_pay_client import ensure_private_key_file
+
+
+def percentile(sorted_values, p):
+    """
+    最近秩法求百分位，sorted_values 需已排序
+    """
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class LatencyRecorder:
+    """
+    线程安全地记录每类操作的耗时和成功/失败次数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._errors = {}
+
+    def record(self, op, seconds, ok):
+        with self._lock:
+            if ok:
+                self._samples.setdefault(op, []).append(seconds)
+            else:
+                self._errors[op] = self._errors.get(op, 0) + 1
+            self._samples.setdefault(op, [])
+
+    def summary(self, elapsed):
+        with self._lock:
+            result = {}
+            for op, samples in self._samples.items():
+                values = sorted(samples)
+                ms = [v * 1000 for v in values]
+                result[op] = {
+                    "ok": len(values),
+                    "errors": self._errors.get(op, 0),
+                    "throughput_per_sec": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+                    "mean_ms": round(sum(ms) / len(ms), 2) if ms else None,
+                    "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+                    "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+                    "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+                    "max_ms": round(ms[-1], 2) if ms else None,
+                }
+            return result
+
+
+def run_scenario(client, recorder, out_trade_no, queries_per_order, pay):
+    """
+    一个顾客的流程：下单 -> (可选)支付 -> 查单若干次
+    """
+    start = time.perf_counter()
+    code_url = client.unified_order(out_trade_no, 1, "loadtest")
+    recorder.record("create", time.perf_counter() - start, code_url is not None)
+    if code_url is None:
+        return
+
+    if pay:
+        start = time.perf_counter()
+        try:
+            resp = client.session.post(f"{client.host}/fakepay/{out_trade_no}", timeout=client.timeout)
+            ok = resp.status_code == 200
+        except Exception:
+            ok = False
+        recorder.record("fakepay", time.perf_counter() - start, ok)
+
+    for _ in range(queries_per_order):
+        start = time.perf_counter()
+        state = client.query_order(out_trade_no)
+        recorder.record("query", time.perf_counter() - start, state is not None)
+
+
+def run_load(host, key_path, rate, concurrency, duration, queries_per_order, pay_ratio):
+    """
+    开环压测：按 rate(订单/秒)匀速发起流程，最多 concurrency 个同时在途
+    """
+    client = pay_v3.PayClient(host=host, mchid="loadtest", private_key_path=key_path,
+                              pool_maxsize=concurrency, retries=0)
+    # 预先加载私钥，不计入第一个请求的耗时
+    client.private_key
+    recorder = LatencyRecorder()
+    prefix = f"LT{int(time.time())}"
+    # 按比例决定哪些订单要支付：累加器方式，分布均匀
+    pay_acc = 0.0
+    interval = 1.0 / rate
+    launched = 0
+    late = 0
+    inflight = threading.BoundedSemaphore(concurrency)
+
+    def _job(no, pay):
+        try:
+            run_scenario(client, recorder, no, queries_per_order, pay)
+        finally:
+            inflight.release()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest") as pool:
+        while True:
+            next_at = start + launched * interval
+            now = time.perf_counter()
+            if next_at - start >= duration:
+                break
+            if next_at > now:
+                time.sleep(next_at - now)
+            # 并发已满时等待，记录发起落后的次数(说明目标速率超过了系统能力)
+            if not inflight.acquire(blocking=False):
+                late += 1
+                inflight.acquire()
+            pay_acc += pay_ratio
+            pay = pay_acc >= 1.0
+            if pay:
+                pay_acc -= 1.0
+            pool.submit(_job, f"{prefix}{launched:08d}", pay)
+            launched += 1
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    return {
+        "orders_launched": launched,
+        "launch_blocked_by_concurrency": late,
+        "elapsed_sec": round(elapsed, 3),
+        "operations": recorder.summary(elapsed),
+    }
+
+
+def fetch_server_stats(host):
+    try:
+        import requests
+        return requests.get(f"{host}/fakeserver/stats", timeout=5).json()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="fake_server 支付接口压测")
+    parser.add_argument("--rate", type=float, default=20, help="每秒发起的订单数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的订单流程上限")
+    parser.add_argument("--duration", type=float, default=10, help="压测时长(秒)")
+    parser.add_argument("--queries", type=int, default=3, help="每个订单查单次数")
+    parser.add_argument("--pay-ratio", type=float, default=0.0, help="调用 /fakepay 模拟支付的订单比例 0~1")
+    parser.add_argument("--host", default=None, help="已运行的服务地址，不填则自动启动 fake_server")
+    parser.add_argument("--port", type=int, default=8021, help="自动启动 fake_server 的端口")
+    parser.add_argument("--latency-ms", type=float, default=0, help="自动启动的 fake_server 模拟的网络延迟")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 文件，不填则打印到标准输出")
+    args = parser.parse_args(argv)
+
+    proc = None
+    host = args.host
+    if host is None:
+        proc = fake_server.spawn_process(port=args.port, latency_ms=args.latency_ms)
+        host = f"http://127.0.0.1:{args.port}"
+    key_path = ensure_private_key_file()
+    try:
+        result = run_load(host, key_path, args.rate, args.concurrency, args.duration,
+                          args.queries, args.pay_ratio)
+        result["server_stats"] = fetch_server_stats(host)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if key_path != pay_v3.MERCHANT_PRIVATE_KEY_PATH:
+            os.remove(key_path)
+
+    result["config"] = {
+        "host": host,
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "queries_per_order": args.queries,
+        "pay_ratio": args.pay_ratio,
+        "latency_ms": args.latency_ms if proc is not None else None,
+    }
+    result["timestamp"] = datetime.now().isoformat(timespec="seconds")
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"压测结果已写入 {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
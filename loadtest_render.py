@@ -0,0 +1,142 @@
+# loadtest_render.py
+"""
+渲染服务容量测试：启动本地 render_server(独立进程)，用 N 个并发客户端循环上传照片，
+统计吞吐、延迟分位数和被 429 拒绝的比例，输出 JSON：
+
+    python loadtest_render.py --clients 8 --workers 4 --queue 4 --duration 20 -o render.json
+
+已有服务时可用 --host 指定，不再自动启动。
+"""
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+from PIL import Image
+
+import server_utils
+from loadtest_pay import LatencyRecorder
+
+SAMPLE_PHOTO = "captured.jpg"
+
+
+def make_sample_jpeg(size=(1280, 720)):
+    """
+    kiosk 上传的照片：captured.jpg 缩放到指定尺寸，没有就用渐变图
+    """
+    try:
+        with Image.open(SAMPLE_PHOTO) as im:
+            photo = im.convert("RGB").resize(size)
+    except OSError:
+        photo = Image.linear_gradient("L").convert("RGB").resize(size)
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def run_clients(host, photo_bytes, clients, duration, fmt, weather_str):
+    """
+    闭环压测：每个客户端收到响应后立即发下一个请求；被拒绝时按 Retry-After 等待
+    """
+    recorder = LatencyRecorder()
+    counts = {"rejected": 0, "bytes": 0}
+    counts_lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def _client():
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                resp = session.post(f"{host}/render", files={"photo": ("photo.jpg", photo_bytes)},
+                                    data={"format": fmt, "weather": weather_str}, timeout=60)
+                status = resp.status_code
+                size = len(resp.content)
+            except Exception:
+                status, size = None, 0
+            cost = time.perf_counter() - start
+            if status == 429:
+                with counts_lock:
+                    counts["rejected"] += 1
+                time.sleep(float(resp.headers.get("Retry-After", 1)))
+                continue
+            recorder.record("render", cost, status == 200)
+            if status == 200:
+                with counts_lock:
+                    counts["bytes"] += size
+        session.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=_client, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    summary = recorder.summary(elapsed)
+    return {
+        "elapsed_sec": round(elapsed, 3),
+        "rejected_429": counts["rejected"],
+        "response_mb": round(counts["bytes"] / 1024 / 1024, 2),
+        "operations": summary,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="渲染服务容量测试")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端(kiosk)数")
+    parser.add_argument("--duration", type=float, default=10, help="压测时长(秒)")
+    parser.add_argument("--format", default="jpeg", help="输出格式预设")
+    parser.add_argument("--photo-size", default="1280x720", help="上传照片的尺寸")
+    parser.add_argument("--host", default=None, help="已运行的渲染服务地址，不填则自动启动")
+    parser.add_argument("--port", type=int, default=8041, help="自动启动时的端口")
+    parser.add_argument("--workers", type=int, default=None, help="自动启动时的合成线程数")
+    parser.add_argument("--queue", type=int, default=None, help="自动启动时的排队上限")
+    parser.add_argument("--backend", default=None, choices=("pil", "cv"), help="自动启动时的合成后端")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 文件，不填则打印到标准输出")
+    args = parser.parse_args(argv)
+
+    proc = None
+    host = args.host
+    if host is None:
+        extra = []
+        for flag, value in (("--workers", args.workers), ("--queue", args.queue), ("--backend", args.backend)):
+            if value is not None:
+                extra += [flag, str(value)]
+        proc = server_utils.spawn_process("render_server.py", port=args.port, extra_args=extra)
+        host = f"http://127.0.0.1:{args.port}"
+    width, height = (int(v) for v in args.photo_size.lower().split("x"))
+    try:
+        result = run_clients(host, make_sample_jpeg((width, height)), args.clients, args.duration,
+                             args.format, "多云 4℃")
+        result["server_stats"] = requests.get(f"{host}/render/stats", timeout=5).json()
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    result["config"] = {
+        "host": host,
+        "clients": args.clients,
+        "duration": args.duration,
+        "format": args.format,
+        "photo_size": [width, height],
+    }
+    result["timestamp"] = datetime.now().isoformat(timespec="seconds")
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"压测结果已写入 {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# loadtest_weather.py
+"""
+多城市天气批量获取压测(不需要联网)：启动 fake_weather_server，对比逐个城市请求
+和 WeatherCache 并发刷新的耗时，并测缓存命中时 get_many 的吞吐，输出 JSON：
+
+    python loadtest_weather.py --cities 50 --concurrency 8 --latency-ms 50 -o weather.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+import fake_weather_server
+from loadtest_pay import percentile
+from weather_utils import WeatherCache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多城市天气批量获取压测")
+    parser.add_argument("--cities", type=int, default=20, help="模拟的城市数量")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数(连接池大小)")
+    parser.add_argument("--rounds", type=int, default=3, help="并发刷新的轮数")
+    parser.add_argument("--lookups", type=int, default=10000, help="缓存命中测试中 get_many 的调用次数")
+    parser.add_argument("--port", type=int, default=8031, help="自动启动 mock 服务的端口")
+    parser.add_argument("--latency-ms", type=float, default=30, help="mock 服务模拟的网络延迟")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 文件，不填则打印到标准输出")
+    args = parser.parse_args(argv)
+
+    api_url = f"http://127.0.0.1:{args.port}/v3/weather/weatherInfo"
+    cities = [str(210200 + i) for i in range(args.cities)]
+    proc = fake_weather_server.spawn_process(port=args.port, latency_ms=args.latency_ms)
+    tmp_dir = tempfile.mkdtemp(prefix="weather_bench_")
+    try:
+        # 1. 逐个城市串行请求(旧的单城市写法)
+        start = time.perf_counter()
+        for city in cities:
+            requests.get(api_url, params={"city": city, "key": "bench"}, timeout=5).json()
+        sequential = time.perf_counter() - start
+
+        # 2. WeatherCache 并发刷新所有城市
+        cache = WeatherCache(cities=cities, json_path=os.path.join(tmp_dir, "weather_result.json"),
+                             api_key="bench", api_url=api_url, max_workers=args.concurrency)
+        round_costs = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            result = cache.refresh_cities()
+            round_costs.append(time.perf_counter() - start)
+        # 刷新成功的城市都会写出本地 JSON
+        failed = [c for c in result if not os.path.exists(cache.json_path_for(c))]
+
+        # 3. 缓存命中时批量读取
+        lookup_costs = []
+        for _ in range(args.lookups):
+            start = time.perf_counter()
+            cache.get_many(cities)
+            lookup_costs.append((time.perf_counter() - start) * 1e6)
+        lookup_costs.sort()
+        cache.close()
+        server_counts = requests.get(f"http://127.0.0.1:{args.port}/fakeweather/stats", timeout=5).json()
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    round_costs.sort()
+    report = {
+        "cities": args.cities,
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency_ms,
+        "sequential_fetch_sec": round(sequential, 3),
+        "batch_refresh_sec": {
+            "best": round(round_costs[0], 3),
+            "median": round(percentile(round_costs, 50), 3),
+            "worst": round(round_costs[-1], 3),
+        },
+        "batch_speedup": round(sequential / percentile(round_costs, 50), 2),
+        "failed_cities": failed,
+        "cached_get_many_us": {
+            "p50": round(percentile(lookup_costs, 50), 1),
+            "p95": round(percentile(lookup_costs, 95), 1),
+            "p99": round(percentile(lookup_costs, 99), 1),
+        },
+        "server_requests": sum(server_counts.values()),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"压测结果已写入 {args.output}")
+    else:
+        print(text)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
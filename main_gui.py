@@ -1,52 +1,169 @@
-import tkinter as tk
-import cv2
 import time
-import qrcode
-from PIL import Image, ImageTk
+# 启动计时的起点，放在其他 import 之前
+_IMPORT_START = time.perf_counter()
+
+import argparse
+import sys
+import tkinter as tk
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from PIL import ImageTk
 from datetime import datetime
-from weather_utils import get_weather_info
-from image_utils import create_newspaper_image, TEMPLATE_PATH
-from pay_v3 import native_unified_order, native_query_order
+from image_utils import get_compositor
+from print_spooler import get_print_spooler
+
+# cv2 / requests / qrcode / cryptography 导入很慢(冷启动时要几秒)，都在第一次用到时才导入：
+# 摄像头和人脸裁剪在后台线程里打开，天气、支付模块在后台请求里导入，不拖慢窗口显示
+HEAVY_MODULES = ("cv2", "numpy", "requests", "qrcode", "cryptography")
+
+# 是否定期在控制台打印预览的 FPS / 每帧耗时
+SHOW_PREVIEW_STATS = False
+PREVIEW_STATS_INTERVAL = 10  # 秒
+
+# 网络请求(天气、下单、查单)用的后台线程数，以及界面层面的超时兜底(秒)
+NETWORK_WORKERS = 3
+NETWORK_UI_TIMEOUT = 15
+# 后台任务完成情况的检查间隔(毫秒)
+FUTURE_POLL_MS = 30
+
+# 以人脸为中心裁剪成照片区域的宽高比；预览也显示裁剪后的画面(所见即所印)
+FACE_CROP = True
+
+# 模板加载完成前窗口使用的大小
+DEFAULT_WIN_SIZE = (876, 1072)
+# 第一帧预览出来后，在后台预先导入支付相关模块，第一次点“支付”不用等导入
+PRELOAD_PAYMENT_MODULES = True
+# 启动测量模式：打印从启动到第一帧预览的各阶段耗时后退出(也可以用 --measure-startup)
+MEASURE_STARTUP = False
+
+# 是否把拍到的原始画面另存一份到磁盘(仅做存档，合成不再依赖这个文件)
+ARCHIVE_CAPTURES = False
+CAPTURE_ARCHIVE_PATH = "captured.jpg"
+
+
+def archive_capture_async(frame, path=CAPTURE_ARCHIVE_PATH):
+    """
+    在后台线程里把原始帧写到磁盘，不阻塞 Tk 主线程
+    """
+    def _write():
+        import cv2
+
+        if cv2.imwrite(path, frame):
+            print(f"原始画面已存档到 {path}")
+        else:
+            print(f"原始画面存档失败: {path}")
 
-class NewspaperApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("今日登报 Demo")
+    t = threading.Thread(target=_write, name="capture-archive", daemon=True)
+    t.start()
+    return t
 
-        # 窗口大小可根据模板大小来定
-        self.WIN_WIDTH = 876
-        self.WIN_HEIGHT = 1072
-        # 或者根据模板图实际大小，这里先写死
-        self.root.geometry(f"{self.WIN_WIDTH}x{self.WIN_HEIGHT}")
 
-        # 打开摄像头
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            print("无法打开摄像头！")
-            # 也可以弹个提示后退出
-            return
+def load_template():
+    """
+    后台线程：加载模板(解码 PNG 或映射模板包)，return: (版面, 模板图)
+    """
+    compositor = get_compositor()
+    return compositor.get_layout(), compositor.get_template()
 
-        # 读取模板图并转换成Tkinter可用的图像
-        self.background_image = Image.open(TEMPLATE_PATH).convert("RGB")
-        self.bg_tk = ImageTk.PhotoImage(self.background_image)
 
-        # 用 Label 来承载整个背景图
-        self.bg_label = tk.Label(self.root, image=self.bg_tk)
-        self.bg_label.place(x=0, y=0, width=self.WIN_WIDTH, height=self.WIN_HEIGHT)
+def open_camera(device=0):
+    """
+    后台线程：导入 cv2、打开摄像头并启动采集线程，顺便加载人脸级联；打开失败返回 None
+    """
+    from camera_utils import CameraCapture
 
-        # 摄像头在模板中的“照片区域”大小（根据你的需求设置）
-        self.cam_width = 448
-        self.cam_height = 336
-        # 摄像头在背景中的位置（即贴图位置）
-        self.cam_pos_x = 210
-        self.cam_pos_y = 250
+    camera = CameraCapture(device)
+    if not camera.start():
+        return None
+    if FACE_CROP:
+        from face_crop import load_face_cascade
+        load_face_cascade()
+    return camera
 
-        # 在背景上叠加一个 Label，用来显示摄像头实时画面
-        self.cam_label = tk.Label(self.bg_label)
-        self.cam_label.place(x=self.cam_pos_x, y=self.cam_pos_y, width=self.cam_width, height=self.cam_height)
+
+def release_camera(future):
+    """
+    窗口关闭时摄像头还在打开中：打开完成后立即释放
+    """
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().stop()
+
+
+def fetch_weather():
+    from weather_utils import get_weather_info
+    return get_weather_info()
+
+
+def create_order(trade_no, amount, description):
+    """
+    后台线程：下单，拿到 code_url 后顺便把二维码生成好(进缓存)，主线程只需要贴图
+    return: (code_url, 下单返回的时刻)
+    """
+    from pay_v3 import native_unified_order
+
+    code_url = native_unified_order(trade_no, amount, description)
+    returned_at = time.perf_counter()
+    if code_url:
+        from qr_utils import get_qr_image
+        get_qr_image(code_url)
+    return code_url, returned_at
+
+
+def close_order(trade_no):
+    from pay_v3 import native_close_order
+    return native_close_order(trade_no)
+
+
+def preload_payment_modules():
+    # 只导入不使用，第一次下单、显示二维码时不用再等
+    import qr_utils
+    import payment_watcher
+
+
+class NewspaperApp:
+    def __init__(self, root, measure_startup=MEASURE_STARTUP):
+        self.root = root
+        self.root.title("今日登报 Demo")
+        self.measure_startup = measure_startup
+        # 启动各阶段距离 main_gui 开始导入的秒数
+        self.startup_marks = {}
+        self.mark_startup("app_init")
+
+        # 先用默认大小把窗口显示出来，模板加载完成后再按模板大小调整
+        self.WIN_WIDTH, self.WIN_HEIGHT = DEFAULT_WIN_SIZE
+        self.root.geometry(f"{self.WIN_WIDTH}x{self.WIN_HEIGHT}")
+        self.root.after_idle(self.mark_startup, "window_shown")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # 所有网络请求(以及启动时的模板加载、打开摄像头)都放到这个线程池里，结果通过 root.after 回到 Tk 主线程
+        self.executor = ThreadPoolExecutor(max_workers=NETWORK_WORKERS, thread_name_prefix="kiosk-net")
+        self.is_closing = False
+        # 其他线程需要在 Tk 主线程执行的回调，统一放进队列由主线程取出执行
+        self.ui_calls = queue.Queue()
+        self.drain_ui_calls()
+
+        # 模板、摄像头都在后台准备，两者都就绪后才开始预览
+        self.layout = None
+        self.background_image = None
+        self.camera = None
+        self.camera_status = "摄像头启动中..."
+        self.cam_label = None
+        self.preview = None
+        self.face_crop = None
+        # 上一次显示到预览里的帧序号，没有新帧时不重复刷新
+        self.last_frame_seq = -1
+        # 冻结画面只需要渲染一次，记下已经渲染过的是哪一帧
+        self.frozen_rendered = None
+        self.last_stats_time = time.monotonic()
+
+        # 用 Label 来承载整个背景图，模板加载完成前显示启动提示
+        self.bg_label = tk.Label(self.root, text="启动中...")
+        self.bg_label.place(x=0, y=0, width=self.WIN_WIDTH, height=self.WIN_HEIGHT)
 
         # 按鈕 “支付”
-        self.btn_pay = tk.Button(self.root, text="支付", command=self.on_capture)
+        self.btn_pay = tk.Button(self.root, text="支付", command=self.on_pay)
         self.btn_pay.place(x=330, y=10, width=80, height=30)
         # 按鈕 “拍照”
         self.btn_capture = tk.Button(self.root, text="拍照", command=self.on_capture)
@@ -58,10 +175,16 @@ class NewspaperApp:
         # 初始时，“拍照” “打印”按钮禁用
         self.btn_capture["state"] = "disabled"
         self.btn_print["state"] = "disabled"
-        # 天气信息（可提前获取并显示）
-        self.weather_str = get_weather_info()
-        # 这里简单地在窗口标题栏显示天气，可自行修改
-        self.root.title(f"今日登报 - 天气：{self.weather_str}")
+
+        # 模板解码、打开摄像头、获取天气三件事并行进行，窗口不等它们
+        self.run_async(load_template, on_done=self.on_template_ready, on_error=self.on_template_error)
+        self.camera_future = self.run_async(open_camera, on_done=self.on_camera_ready,
+                                            on_error=self.on_camera_error)
+        # 天气信息（后台获取，拿到之前先显示获取中，并用默认天气兜底）
+        self.weather_str = "晴 25℃"
+        self.root.title("今日登报 - 天气：获取中...")
+        self.run_async(fetch_weather, on_done=self.on_weather_ready,
+                       on_error=self.on_weather_error, timeout=NETWORK_UI_TIMEOUT)
 
         # 是否冻结画面
         self.is_freeze = False
@@ -73,50 +196,157 @@ class NewspaperApp:
         # 二维码Label
         self.qr_label = tk.Label(self.root)
         self.qr_label.place(x=650, y=50, width=200, height=200)
-        # 订单相关
+        # 订单相关：所有未完成订单由一个 PaymentWatcher 统一轮询(第一次下单时创建)
         self.current_trade_no = None
-        self.is_polling = False
+        self.payment_watcher = None
+        # 打印在后台排队进行，界面不等打印机
+        self.print_spooler = get_print_spooler()
+
+    # ---------- 启动 ----------
+
+    def mark_startup(self, name):
+        """
+        记录某个启动阶段完成的时间(只记第一次)
+        """
+        self.startup_marks.setdefault(name, time.perf_counter() - _IMPORT_START)
+
+    def get_startup_report(self):
+        """
+        各启动阶段距离 main_gui 开始导入的毫秒数(不含解释器自身的启动)，以及此时已经导入的重模块
+        """
+        report = {name: round(t * 1000, 1) for name, t in sorted(self.startup_marks.items(), key=lambda kv: kv[1])}
+        report["loaded_modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+        return report
+
+    def on_template_ready(self, result):
+        """
+        模板加载完成(Tk 主线程)：按模板调整窗口，摆好照片区域
+        """
+        self.mark_startup("template_ready")
+        # 窗口大小、照片区域都跟着模板(PNG 或模板包)的版面走
+        self.layout, self.background_image = result
+        self.WIN_WIDTH, self.WIN_HEIGHT = self.background_image.size
+        self.root.geometry(f"{self.WIN_WIDTH}x{self.WIN_HEIGHT}")
+
+        # 模板图转换成Tkinter可用的图像(与合成器共用同一份已解码的模板)
+        self.bg_tk = ImageTk.PhotoImage(self.background_image)
+        self.bg_label.configure(image=self.bg_tk, text="")
+        self.bg_label.place(x=0, y=0, width=self.WIN_WIDTH, height=self.WIN_HEIGHT)
+
+        # 摄像头在模板中的“照片区域”大小
+        self.cam_width, self.cam_height = self.layout.photo_size
+        # 摄像头在背景中的位置（即贴图位置）
+        self.cam_pos_x, self.cam_pos_y = self.layout.photo_pos
+
+        # 在背景上叠加一个 Label，用来显示摄像头实时画面
+        self.cam_label = tk.Label(self.bg_label, text=self.camera_status)
+        self.cam_label.place(x=self.cam_pos_x, y=self.cam_pos_y, width=self.cam_width, height=self.cam_height)
+        self.start_preview_if_ready()
+
+    def on_template_error(self, exc):
+        print("加载报纸模板失败:", exc)
+        self.bg_label.configure(text="报纸模板加载失败")
+
+    def on_camera_ready(self, camera):
+        """
+        摄像头打开完成(Tk 主线程)，camera 为 None 表示打开失败
+        """
+        if camera is None:
+            # 也可以弹个提示后退出
+            self.camera_status = "摄像头打开失败"
+            print(self.camera_status)
+            if self.cam_label is not None:
+                self.cam_label.configure(text=self.camera_status)
+            return
+        self.mark_startup("camera_ready")
+        self.camera = camera
+        self.start_preview_if_ready()
+
+    def on_camera_error(self, exc):
+        print("打开摄像头异常:", exc)
+        self.on_camera_ready(None)
+
+    def start_preview_if_ready(self):
+        """
+        模板和摄像头都就绪后(先后顺序不定)开始预览
+        """
+        if self.layout is None or self.camera is None or self.preview is not None:
+            return
+        # 两个模块在打开摄像头的后台线程里已经导入过，这里不会再等
+        from camera_utils import PreviewRenderer
+        from face_crop import FaceCropTracker
+
+        # 后台在缩小的画面上检测人脸，拍照时直接用算好的裁剪框
+        self.face_crop = FaceCropTracker(aspect=self.layout.photo_aspect) if FACE_CROP else None
+        if self.face_crop is not None:
+            self.face_crop.start(self.camera)
+        # 预览渲染器复用预分配的缓冲区，并原地更新同一个 PhotoImage
+        self.preview = PreviewRenderer(self.cam_width, self.cam_height, sink=self.paste_preview)
+        self.cam_imgtk = ImageTk.PhotoImage(self.preview.mode, (self.cam_width, self.cam_height))
+        self.cam_label.configure(image=self.cam_imgtk, text="")
 
         # 启动循环更新摄像头画面
         self.update_frame()
 
+    def on_first_preview_frame(self):
+        """
+        第一帧预览已经画到界面上：记录启动耗时，之后再做不急的预热
+        """
+        self.root.update_idletasks()
+        self.mark_startup("first_preview_frame")
+        metrics.observe("startup_first_frame", self.startup_marks["first_preview_frame"])
+        print("启动耗时(ms):", self.get_startup_report())
+        if PRELOAD_PAYMENT_MODULES:
+            self.executor.submit(preload_payment_modules)
+        if self.measure_startup:
+            self.root.after_idle(self.on_close)
+
     def update_frame(self):
         """
         实时更新摄像头画面 / 处理倒计时逻辑。
         """
-        # 如果处于冻结状态，不再从摄像头读取新帧，而是一直显示 self.captured_frame
+        # 如果处于冻结状态，不再从摄像头读取新帧，而是显示 self.captured_frame，
+        # 同一张冻结画面只渲染一次
         if self.is_freeze and self.captured_frame is not None:
-            # 把 captured_frame (BGR->RGB) 转成 Tk
-            frame_rgb = cv2.cvtColor(self.captured_frame, cv2.COLOR_BGR2RGB)
-            frame_rgb = cv2.resize(frame_rgb, (self.cam_width, self.cam_height))
-            img = Image.fromarray(frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.cam_label.imgtk = imgtk
-            self.cam_label.configure(image=imgtk)
+            if self.frozen_rendered is not self.captured_frame:
+                self.preview.render(self.captured_frame)
+                self.frozen_rendered = self.captured_frame
         else:
-            # 正常读取摄像头画面
-            ret, frame = self.cap.read()
-            if ret:
-                # 如果在倒计时中，就在画面上叠加倒计时数字
-                if self.countdown_value > 0:
-                    text = str(self.countdown_value)
-                    # 在画面上写倒计时数字（OpenCV方式）
-                    cv2.putText(frame, text, 
-                                (int(self.cam_width/2 - 20), int(self.cam_height/2)), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 
-                                2, (0, 0, 255), 5)
-
-                # 显示到 cam_label
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_rgb = cv2.resize(frame_rgb, (self.cam_width, self.cam_height))
-                img = Image.fromarray(frame_rgb)
-                imgtk = ImageTk.PhotoImage(image=img)
-                self.cam_label.imgtk = imgtk
-                self.cam_label.configure(image=imgtk)
+            self.frozen_rendered = None
+            # 取采集线程里最新的一帧(不阻塞)，没有新帧就跳过这一轮
+            frame, seq = self.camera.read_latest()
+            if frame is not None and seq != self.last_frame_seq:
+                self.last_frame_seq = seq
+                # 如果在倒计时中，就在预览上叠加倒计时数字(画在缩放后的缓冲区里，不改动原始帧)
+                overlay = str(self.countdown_value) if self.countdown_value > 0 else None
+                if self.face_crop is not None:
+                    frame = self.face_crop.crop(frame)
+                self.preview.render(frame, overlay_text=overlay)
+                if "first_preview_frame" not in self.startup_marks:
+                    self.on_first_preview_frame()
+
+        if SHOW_PREVIEW_STATS and time.monotonic() - self.last_stats_time >= PREVIEW_STATS_INTERVAL:
+            self.last_stats_time = time.monotonic()
+            print("预览统计:", self.get_preview_stats())
 
         # 递归调用自己
         self.root.after(50, self.update_frame)
 
+    def paste_preview(self, img):
+        """
+        原地更新预览用的 PhotoImage，不再每帧新建
+        """
+        self.cam_imgtk.paste(img)
+
+    def get_preview_stats(self):
+        """
+        预览的实际 FPS、每帧耗时(ms)、采集线程最新帧的延迟
+        """
+        stats = self.preview.stats()
+        age = self.camera.frame_age()
+        stats["frame_age_ms"] = None if age is None else round(age * 1000, 1)
+        return stats
+
     def on_pay(self):
         """
         1。生成单号
@@ -124,53 +354,97 @@ class NewspaperApp:
         3. 显示二维码
         4. 开始轮询订单状态
         """
-        self.is_polling = False
+        # 上一个订单还没支付就放弃它：停止轮询并在后台关单，废弃的二维码不再一直查询
+        self.abandon_order(self.current_trade_no)
+
         # 订单号
         self.current_trade_no = datetime.now().strftime("%Y%m%d%H%M%S")
-        self.current_trade_no += str(int(time.time())) # 拼接时间戳
+        self.current_trade_no += str(int(time.time() * 1000)) # 拼接毫秒时间戳，连续下单也不会重号
 
-        # 下单
-        code_url = native_unified_order(out_trade_no=self.current_trade_no,
-                                        total_fee=9.9,
-                                        description="报纸大头贴")
+        # 下单(后台线程)，期间显示等待状态，避免重复点击
+        self.btn_pay.configure(state="disabled")
+        self.qr_label.config(image="", text="下单中...")
+        self.qr_label.image = None
+        self.run_async(create_order, self.current_trade_no, 9.9, "报纸大头贴",
+                       on_done=lambda result, trade_no=self.current_trade_no: self.on_order_created(trade_no, *result),
+                       on_error=self.on_order_error, timeout=NETWORK_UI_TIMEOUT)
+
+    def on_order_created(self, trade_no, code_url, returned_at=None):
+        """
+        下单返回(Tk 主线程)
+        returned_at: 后台下单返回的时刻，用来统计从下单返回到二维码显示出来的耗时
+        """
+        self.btn_pay.configure(state="normal")
+        if trade_no != self.current_trade_no:
+            # 期间又下了新单，忽略旧结果
+            return
         if not code_url:
             print("下单失败，无法生成二维码")
+            self.qr_label.config(text="下单失败")
             return
-        
-        # 生成二维码
-        qr_img = qrcode.make(code_url)
-        qr_img.save("pay_qr.png")
-        # 显示到画面
-        qr_tk = ImageTk.PhotoImage(qr_img)
-        self.qr_label.config(image=qr_tk)
-        self.qr_label.image = qr_tk
 
-        # 开始轮询订单状态
-        self.is_polling = True
-        # self.po
+        # 二维码在内存里按 Label 大小生成(后台下单时已经放进缓存)，不落盘
+        from qr_utils import get_qr_image
+
+        with metrics.timer("qr_show"):
+            qr_tk = ImageTk.PhotoImage(get_qr_image(code_url))
+            self.qr_label.config(image=qr_tk, text="")
+            self.qr_label.image = qr_tk
+        if returned_at is not None:
+            metrics.observe("qr_display", time.perf_counter() - returned_at)
+
+        # 交给 PaymentWatcher 轮询订单状态，状态变化时回调
+        self.get_payment_watcher().watch(trade_no, on_change=self.on_payment_state_changed)
 
-    def poll_payment_status(self):
+    def abandon_order(self, trade_no):
         """
-        轮询订单状态
+        不再等待 trade_no 的支付(顾客重新下单)：停止轮询，并在后台关闭订单，关闭后二维码扫了也付不了
         """
-        if not self.is_polling:
+        if trade_no is None or self.payment_watcher is None:
             return
-        state = native_query_order(self.current_trade_no)
-        if state == "SUCCESS":
+        if trade_no not in self.payment_watcher.pending():
+            # 已经支付/关闭/过期，或者还没开始轮询
+            return
+        self.payment_watcher.unwatch(trade_no)
+        print(f"放弃未支付订单 {trade_no}")
+        self.run_async(close_order, trade_no, on_error=lambda e: print("关闭旧订单失败:", e),
+                       timeout=NETWORK_UI_TIMEOUT)
+
+    def get_payment_watcher(self):
+        if self.payment_watcher is None:
+            from payment_watcher import PaymentWatcher
+            self.payment_watcher = PaymentWatcher(dispatch=self.call_in_ui)
+        return self.payment_watcher
+
+    def on_order_error(self, exc):
+        print("下单请求异常:", exc)
+        self.btn_pay.configure(state="normal")
+        self.qr_label.config(text="下单超时，请重试")
+
+    def on_payment_state_changed(self, trade_no, old_state, new_state):
+        """
+        订单状态变化(已经转交到 Tk 主线程)
+        """
+        from payment_watcher import EXPIRED_STATE
+
+        if trade_no != self.current_trade_no:
+            return
+        if new_state == "SUCCESS":
             print("用户支付成功!")
-            self.is_polling = False
             # 清除二维码
-            self.qr_label.config(image=None)
+            self.qr_label.config(image="")
             self.qr_label.image = None
             # 自动触发拍照
             self.auto_capture_after_payment()
-        elif state in ["NOTPAY", "USERPAYING", None]:
-            # 继续轮询
-            self.root.after(2000, self.poll_payment_status)
+        elif new_state in ["NOTPAY", "USERPAYING"]:
+            # 继续等待，PaymentWatcher 会接着轮询
+            pass
         else:
-            # 其他状态(CLOSED, PAYERROR等)
-            print("订单状态:", state, "停止轮询")
-            self.is_polling = False
+            # 其他状态(CLOSED, PAYERROR, 本地超时 EXPIRED 等)
+            print("订单状态:", new_state, "停止轮询")
+            if new_state == EXPIRED_STATE:
+                self.qr_label.config(image="", text="订单已过期")
+                self.qr_label.image = None
 
     def auto_capture_after_payment(self):
         print("3秒后自动拍照!")
@@ -188,6 +462,9 @@ class NewspaperApp:
         # if self.is_freeze or self.countdown_value > 0:
         #     return
 
+        if self.preview is None:
+            # 摄像头还没就绪
+            return
         self.is_freeze = False
 
         # 先将“打印”按钮置为禁用
@@ -213,14 +490,21 @@ class NewspaperApp:
     def capture_and_freeze(self):
         """
         倒计时结束后，拍照并冻结当前画面
+        直接取采集线程里最新的一帧，不再做一次阻塞读帧
         """
-        ret, frame = self.cap.read()
-        if ret:
-            # 保存当前帧到内存
+        with metrics.timer("camera_capture"):
+            frame, _ = self.camera.read_latest() if self.camera is not None else (None, None)
+        metrics.inc("camera_capture", result="ok" if frame is not None else "no_frame")
+        if frame is not None:
+            # 套用后台已经算好的人脸裁剪框(全分辨率帧上的切片，不再做检测)
+            if self.face_crop is not None:
+                frame = self.face_crop.crop(frame)
+            # 保存当前帧到内存，合成时直接使用，不再经过 captured.jpg
             self.captured_frame = frame
-            # 也可以先行保存到文件
-            cv2.imwrite("captured.jpg", frame)
-            print("拍照完成，已保存到 captured.jpg")
+            print("拍照完成")
+            # 可选：异步存档原始画面
+            if ARCHIVE_CAPTURES:
+                archive_capture_async(frame.copy())
 
             # 冻结画面
             self.is_freeze = True
@@ -233,31 +517,138 @@ class NewspaperApp:
     def on_print(self):
         """
         点击“打印”按钮，只有在冻结状态下才可点击。
-        - 生成报纸图
-        - 调用打印或保存
-        - 恢复摄像头动态捕捉
+        - 生成报纸图(后台)
+        - 交给打印队列
+        - 立即恢复摄像头动态捕捉，不等合成和打印完成
         """
         if not self.is_freeze:
             return
 
-        # 先把冻结画面保存一下（也可用上面拍照时保存的 captured.jpg）
-        photo_path = "captured.jpg"
+        # 直接把内存中的冻结画面(BGR ndarray)交给合成逻辑，无需磁盘读写；
+        # 合成在后台线程完成，Tk 主循环不会被阻塞。合成结果(PIL Image)直接交给打印队列，
+        # 每个任务持有自己的图片，不经过同一个文件，也不再编码后解码
+        self.btn_print.configure(state="disabled")  # 打印完立刻禁用
+        future = get_compositor().render_async(self.captured_frame, self.weather_str)
+        self.watch_future(future, on_done=self.on_newspaper_ready, on_error=self.on_newspaper_error)
+        # 采集线程每次都产生新的帧数组，合成用的 captured_frame 不会被覆盖，可以直接回到实时预览
+        self.is_freeze = False
 
-        # 调用你的合成报纸图逻辑
-        final_path = create_newspaper_image(photo_path, self.weather_str)
-        print("最终报纸图片：", final_path)
+    def call_in_ui(self, fn):
+        """
+        可以在任意线程调用：把 fn 交给 Tk 主线程执行
+        """
+        self.ui_calls.put(fn)
 
-        # TODO：此处可调用打印机逻辑
-        print("正在调用打印机...")
+    def drain_ui_calls(self):
+        if self.is_closing:
+            return
+        while True:
+            try:
+                fn = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn()
+            except Exception as e:
+                print("界面回调异常:", e)
+        self.root.after(FUTURE_POLL_MS, self.drain_ui_calls)
+
+    def run_async(self, fn, *args, on_done=None, on_error=None, timeout=None):
+        """
+        把 fn(*args) 放到后台线程池执行，完成后在 Tk 主线程回调：
+          on_done(result) / on_error(exception)；超过 timeout 秒按 TimeoutError 处理
+        """
+        future = self.executor.submit(fn, *args)
+        self.watch_future(future, on_done=on_done, on_error=on_error, timeout=timeout)
+        return future
 
-        # 打印后一直处于静止状态
-        # self.is_freeze = False
-        self.btn_print.configure(state="disabled")  # 打印完立刻禁用
+    def watch_future(self, future, on_done=None, on_error=None, timeout=None):
+        """
+        在 Tk 主线程里用 root.after 轮询 Future，不阻塞主循环
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._check_future(future, on_done, on_error, deadline)
+
+    def _check_future(self, future, on_done, on_error, deadline):
+        if self.is_closing or future.cancelled():
+            return
+        if future.done():
+            exc = future.exception()
+            if exc is not None:
+                if on_error:
+                    on_error(exc)
+                else:
+                    print("后台任务异常:", exc)
+            elif on_done:
+                on_done(future.result())
+            return
+        if deadline is not None and time.monotonic() > deadline:
+            # 还没开始的任务直接取消；已经在跑的只能放弃它的结果
+            future.cancel()
+            if on_error:
+                on_error(TimeoutError("后台任务超时"))
+            return
+        self.root.after(FUTURE_POLL_MS, self._check_future, future, on_done, on_error, deadline)
+
+    def on_weather_ready(self, weather_str):
+        self.mark_startup("weather_ready")
+        self.weather_str = weather_str
+        # 这里简单地在窗口标题栏显示天气，可自行修改
+        self.root.title(f"今日登报 - 天气：{self.weather_str}")
+
+    def on_weather_error(self, exc):
+        print("获取天气失败，使用默认天气:", exc)
+        self.root.title(f"今日登报 - 天气：{self.weather_str}")
+
+    def on_newspaper_error(self, exc):
+        print("报纸图片生成失败:", exc)
+        # 恢复到冻结的照片，让顾客可以再点一次“打印”(期间已经开始新的倒计时就不打断)
+        if self.countdown_value == 0 and self.captured_frame is not None:
+            self.is_freeze = True
+            self.btn_print.configure(state="normal")
+
+    def on_newspaper_ready(self, newspaper):
+        job = self.print_spooler.submit(
+            newspaper, on_done=lambda job: self.call_in_ui(lambda: self.on_print_finished(job)))
+        if job is None:
+            self.root.title("今日登报 - 打印队列已满，请稍后")
+
+    def on_print_finished(self, job):
+        """
+        打印任务结束(已经转交到 Tk 主线程)
+        """
+        if job.status == "failed":
+            print(f"打印失败: {job.error}")
+        print("打印队列:", self.print_spooler.stats())
+
+    def on_close(self):
+        """
+        关闭窗口时取消未完成的网络请求，停止采集线程、释放摄像头
+        """
+        self.is_closing = True
+        if self.payment_watcher is not None:
+            self.payment_watcher.stop()
+        # 不等排队中的打印任务；正在打印的任务写完当前这一份就停(最多等 STOP_TIMEOUT 秒)
+        self.print_spooler.shutdown(wait=False)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.face_crop is not None:
+            self.face_crop.stop()
+        if self.camera is not None:
+            self.camera.stop()
+        else:
+            self.camera_future.add_done_callback(release_camera)
+        self.root.destroy()
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="今日登报 kiosk")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="启动测量模式：打印到第一帧预览的各阶段耗时后退出")
+    args = parser.parse_args(argv)
+    # 设置了 KIOSK_METRICS 时开启埋点和导出，见 metrics.py
+    metrics.configure_from_env()
     root = tk.Tk()
-    app = NewspaperApp(root)
+    app = NewspaperApp(root, measure_startup=args.measure_startup or MEASURE_STARTUP)
     root.mainloop()
 
 if __name__ == "__main__":
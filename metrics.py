@@ -0,0 +1,342 @@
+# metrics.py
+"""
+kiosk 流程的轻量埋点：计时直方图 + 计数器(命中/未命中/错误)。
+
+默认关闭，关闭时每次调用只多一次布尔判断。开启方式：
+  - 代码里 metrics.enable()，再 start_http_server() / start_jsonl_writer()
+  - 或设置环境变量后调用 configure_from_env()：
+        KIOSK_METRICS=prometheus:9105       # http://127.0.0.1:9105/metrics
+        KIOSK_METRICS=jsonl:metrics.jsonl   # 每 60 秒追加一行 JSON 快照
+Prometheus 侧可以用 histogram_quantile(0.95, ...) 算出各阶段的 p95。
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# 直方图桶上界(秒)，覆盖从几毫秒的合成到十几秒的网络超时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "kiosk_"
+
+
+class _State:
+    enabled = False
+
+
+_state = _State()
+_lock = threading.Lock()
+# 名字 -> Histogram
+_histograms = {}
+# (名字, 排好序的标签元组) -> 数值
+_counters = {}
+# 名字 -> 当前值(队列深度等)
+_gauges = {}
+
+
+class Histogram:
+    """
+    固定桶的直方图，记录次数、总和以及各桶计数
+    """
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q):
+        """
+        按桶线性插值估算分位数(与 Prometheus histogram_quantile 的算法一致)
+        """
+        counts, count, _ = self.snapshot()
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for i, c in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if cumulative + c >= rank and c > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / c
+            cumulative += c
+            lower = upper
+        return self.buckets[-1]
+
+
+def enable():
+    _state.enabled = True
+
+
+def disable():
+    _state.enabled = False
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def reset():
+    """
+    清空所有已记录的数据(测试、基准用)
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def _histogram(name):
+    hist = _histograms.get(name)
+    if hist is None:
+        with _lock:
+            hist = _histograms.get(name)
+            if hist is None:
+                hist = Histogram(name)
+                _histograms[name] = hist
+    return hist
+
+
+def observe(name, seconds):
+    """
+    记录一次耗时(秒)
+    """
+    if not _state.enabled:
+        return
+    _histogram(name).observe(seconds)
+
+
+def inc(name, value=1, **labels):
+    """
+    计数器 +value，可以带标签，如 inc("weather_cache", result="hit")
+    """
+    if not _state.enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value):
+    """
+    记录一个当前值，如打印队列深度
+    """
+    if not _state.enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _histogram(self.name).observe(time.perf_counter() - self.start)
+        if exc_type is not None:
+            inc("errors", stage=self.name)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """
+    with metrics.timer("camera_capture"): ...
+    关闭时返回共享的空计时器，不分配对象
+    """
+    if not _state.enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name):
+    """
+    装饰器：记录函数耗时，抛异常时错误计数 +1
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                inc("errors", stage=name)
+                raise
+            finally:
+                _histogram(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# ---------- 导出 ----------
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+def render_prometheus():
+    """
+    Prometheus 文本格式(0.0.4)
+    """
+    lines = []
+    with _lock:
+        histograms = list(_histograms.values())
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+
+    for hist in sorted(histograms, key=lambda h: h.name):
+        metric = f"{METRIC_PREFIX}{hist.name}_seconds"
+        counts, count, total = hist.snapshot()
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for upper, c in zip(hist.buckets, counts):
+            cumulative += c
+            lines.append(f'{metric}_bucket{{le="{upper}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{metric}_sum {total}")
+        lines.append(f"{metric}_count {count}")
+
+    for name, value in gauges:
+        metric = f"{METRIC_PREFIX}{name}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"{METRIC_PREFIX}{name}_total"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """
+    当前所有指标的字典快照(JSON-lines 导出用)，直方图附带估算的 p50/p95/p99
+    """
+    with _lock:
+        histograms = list(_histograms.values())
+        counters = list(_counters.items())
+        gauges = dict(_gauges)
+    result = {"timestamp": datetime.now().isoformat(timespec="seconds"), "timers": {}, "counters": {},
+              "gauges": gauges}
+    for hist in histograms:
+        _, count, total = hist.snapshot()
+        result["timers"][hist.name] = {
+            "count": count,
+            "sum": round(total, 6),
+            "p50": hist.quantile(0.5),
+            "p95": hist.quantile(0.95),
+            "p99": hist.quantile(0.99),
+        }
+    for (name, labels), value in counters:
+        key = name + "".join(f",{k}={v}" for k, v in labels)
+        result["counters"][key] = value
+    return result
+
+
+def start_http_server(port=9105, host="127.0.0.1"):
+    """
+    在后台线程提供 GET /metrics，返回 server，用完调用 server.shutdown()
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 抓取很频繁，不打印访问日志
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"指标已开放：http://{host}:{port}/metrics")
+    return server
+
+
+def start_jsonl_writer(path, interval=60.0):
+    """
+    每 interval 秒往 path 追加一行 JSON 快照，返回用于停止的 Event
+    """
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval):
+            write_jsonl(path)
+        write_jsonl(path)
+
+    threading.Thread(target=_loop, name="metrics-jsonl", daemon=True).start()
+    return stop
+
+
+def write_jsonl(path):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(snapshot(), ensure_ascii=False) + "\n")
+
+
+def configure_from_env(var="KIOSK_METRICS"):
+    """
+    按环境变量开启埋点和导出，未设置时什么都不做
+    """
+    spec = os.environ.get(var, "").strip()
+    if not spec:
+        return None
+    kind, _, arg = spec.partition(":")
+    enable()
+    if kind == "prometheus":
+        return start_http_server(port=int(arg or 9105))
+    if kind == "jsonl":
+        return start_jsonl_writer(arg or "metrics.jsonl")
+    print(f"未知的 {var} 配置: {spec}，只在内存中记录")
+    return None
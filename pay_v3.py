@@ -9,10 +9,19 @@ from datetime import datetime
 import requests
 import base64
 import hashlib
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 
+import metrics
+
 # ========== 微信商户平台申请/配置好的信息 ========== #
 WECHATPAY_MCHID = "商户号"
 WECHATPAY_APPID = "AppID"
@@ -21,7 +30,12 @@ WECHATPAY_APIv3_KEY = "APIv3密钥"
 MERCHANT_PRIVATE_KEY_PATH = "resource/merchant_key.pem"
 # 微信支付平台证书(公钥), 用于回调验签(这里仅做示例, 如果要验证回调签名需要)
 WECHATPAY_CERT_PATH = "resource/wechatpay_cert.pem"
+# 商户证书序列号，可通过openssl命令或后台查看，这里先写死做示例
+MERCHANT_CERT_SERIAL_NO = "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
+WECHATPAY_HOST = "https://api.mch.weixin.qq.com"
 MOCK_HOST = "http://127.0.0.1:8000"
+# 实际请求的地址，正式环境改为 WECHATPAY_HOST
+PAY_HOST = MOCK_HOST
 # ====================================================== #
 
 
@@ -69,106 +83,248 @@ def generate_authorization(method, url, body, mchid, serial_no, private_key):
     return auth
 
 
+class PayClient:
+    """
+    可复用的 V3 支付客户端：
+      - 商户私钥只加载、解析一次
+      - 持有一个 requests.Session，keep-alive 连接池 + 重试策略，避免每次请求都重新握手
+      - 提供 下单 / 查单 / 关单
+    """
+
+    def __init__(self, host=None, mchid=WECHATPAY_MCHID, appid=WECHATPAY_APPID,
+                 serial_no=MERCHANT_CERT_SERIAL_NO, private_key_path=MERCHANT_PRIVATE_KEY_PATH,
+                 private_key=None, timeout=10, pool_maxsize=10, retries=2):
+        self.host = host or PAY_HOST
+        self.mchid = mchid
+        self.appid = appid
+        self.serial_no = serial_no
+        self.private_key_path = private_key_path
+        self.timeout = timeout
+        self._private_key = private_key
+        self._key_lock = threading.Lock()
+
+        self.session = requests.Session()
+        # 只对网络错误和 5xx 做有限次重试；下单按 out_trade_no 幂等，重试不会重复扣款
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            backoff_factor=0.2,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @property
+    def private_key(self):
+        """
+        懒加载商户私钥，整个客户端生命周期只解析一次 PEM
+        """
+        if self._private_key is None:
+            with self._key_lock:
+                if self._private_key is None:
+                    self._private_key = load_merchant_private_key(self.private_key_path)
+        return self._private_key
+
+    def _headers(self, method, path, body=""):
+        headers = {
+            "Authorization": generate_authorization(
+                method=method,
+                url=path,
+                body=body,
+                mchid=self.mchid,
+                serial_no=self.serial_no,
+                private_key=self.private_key,
+            ),
+            "Accept": "application/json",
+        }
+        if body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    @metrics.timed("pay_unified_order")
+    def unified_order(self, out_trade_no, total_fee, description="大头贴"):
+        """
+        V3 Native下单接口: POST /v3/pay/transactions/native
+        - out_trade_no: 商户订单号(确保唯一)
+        - total_fee: 价格(单位: 分)
+        - description: 商品描述
+        return: code_url or None
+        """
+        path = "/v3/pay/transactions/native"
+        data = {
+            "mchid": self.mchid,
+            "appid": self.appid,
+            "description": description,
+            "out_trade_no": out_trade_no,
+            "notify_url": "https://www.example.com/wxpay/callback",  # 没有公网也要写
+            "amount": {
+                "total": total_fee,        # int类型: 单位分
+                "currency": "CNY"
+            },
+        }
+        body_str = json.dumps(data, ensure_ascii=False)
+        try:
+            resp = self.session.post(self.host + path, headers=self._headers("POST", path, body_str),
+                                     data=body_str.encode("utf-8"), timeout=self.timeout)
+            if resp.status_code == 200 or resp.status_code == 201:
+                # 返回中会包含 code_url
+                return resp.json().get("code_url")
+            else:
+                print("下单接口返回非200:", resp.status_code, resp.text)
+        except Exception as e:
+            print("请求下单接口异常:", e)
+        metrics.inc("pay_errors", op="unified_order")
+        return None
+
+    @metrics.timed("pay_query_order")
+    def query_order(self, out_trade_no):
+        """
+        V3 查询订单: GET /v3/pay/transactions/out-trade-no/{out_trade_no}?mchid=xxx
+        return: 订单状态trade_state, 可能是 SUCCESS, NOTPAY, etc.
+        """
+        # 签名用的 path 必须和实际发出的完全一致，所以这里先做好 URL 编码
+        path = f"/v3/pay/transactions/out-trade-no/{quote(out_trade_no)}?mchid={quote(self.mchid)}"
+        try:
+            resp = self.session.get(self.host + path, headers=self._headers("GET", path), timeout=self.timeout)
+            if resp.status_code == 200:
+                return resp.json().get("trade_state")  # SUCCESS, NOTPAY, ...
+            else:
+                print("查询订单接口返回:", resp.status_code, resp.text)
+        except Exception as e:
+            print("查询订单接口异常:", e)
+        metrics.inc("pay_errors", op="query_order")
+        return None
+
+    def close_order(self, out_trade_no):
+        """
+        V3 关闭订单: POST /v3/pay/transactions/out-trade-no/{out_trade_no}/close
+        return: 成功返回 True
+        """
+        path = f"/v3/pay/transactions/out-trade-no/{quote(out_trade_no)}/close"
+        body_str = json.dumps({"mchid": self.mchid}, ensure_ascii=False)
+        try:
+            resp = self.session.post(self.host + path, headers=self._headers("POST", path, body_str),
+                                     data=body_str.encode("utf-8"), timeout=self.timeout)
+            if resp.status_code in (200, 204):
+                return True
+            print("关闭订单接口返回:", resp.status_code, resp.text)
+        except Exception as e:
+            print("关闭订单接口异常:", e)
+        return False
+
+    def close(self):
+        """
+        释放连接池
+        """
+        self.session.close()
+
+
+class AsyncPayClient:
+    """
+    asyncio 版本的 V3 支付接口，用于日终对账这类一次查成千上万个订单的场景：
+      - 所有请求共享同一个 PayClient(私钥只解析一次，连接池复用)
+      - asyncio.Semaphore 限制同时在途的请求数
+      - 不引入额外的异步 HTTP 依赖，阻塞的 requests 调用放在大小等于并发上限的线程池里执行
+    """
+
+    def __init__(self, client=None, concurrency=16, **client_kwargs):
+        self.concurrency = concurrency
+        # 连接池大小和并发上限保持一致，避免连接被反复丢弃重建
+        client_kwargs.setdefault("pool_maxsize", concurrency)
+        self._owns_client = client is None
+        self.client = client or PayClient(**client_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pay-async")
+        self._semaphore = None
+
+    async def _call(self, fn, *args):
+        if self._semaphore is None:
+            # Semaphore 要在事件循环里创建
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def unified_order(self, out_trade_no, total_fee, description="大头贴"):
+        return await self._call(self.client.unified_order, out_trade_no, total_fee, description)
+
+    async def query_order(self, out_trade_no):
+        return await self._call(self.client.query_order, out_trade_no)
+
+    async def close_order(self, out_trade_no):
+        return await self._call(self.client.close_order, out_trade_no)
+
+    async def query_orders(self, out_trade_nos):
+        """
+        并发查询一批订单
+        return: {out_trade_no: trade_state}，查询失败的为 None
+        """
+        out_trade_nos = list(dict.fromkeys(out_trade_nos))
+        # 私钥在进入并发前先加载好，避免第一批请求一起等锁
+        await asyncio.get_running_loop().run_in_executor(self._executor, lambda: self.client.private_key)
+        states = await asyncio.gather(*(self.query_order(no) for no in out_trade_nos))
+        return dict(zip(out_trade_nos, states))
+
+    async def aclose(self):
+        self._executor.shutdown(wait=True)
+        if self._owns_client:
+            self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+def query_orders_bulk(out_trade_nos, concurrency=16, **client_kwargs):
+    """
+    同步入口：并发查询一批订单，return {out_trade_no: trade_state}
+    """
+    async def _run():
+        async with AsyncPayClient(concurrency=concurrency, **client_kwargs) as client:
+            return await client.query_orders(out_trade_nos)
+
+    return asyncio.run(_run())
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_pay_client():
+    """
+    获取进程内共享的支付客户端(懒加载)
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = PayClient()
+    return _default_client
+
+
 def native_unified_order(out_trade_no, total_fee, description="大头贴"):
     """
-    V3 Native下单接口: POST /v3/pay/transactions/native
-    - out_trade_no: 商户订单号(确保唯一)
-    - total_fee: 价格(单位: 分)
-    - description: 商品描述
+    V3 Native下单接口，见 PayClient.unified_order
     return: code_url or None
     """
-    # 1. 加载私钥、获取序列号(需要你自己从商户平台或pem证书中读取)
-    private_key = load_merchant_private_key(MERCHANT_PRIVATE_KEY_PATH)
-    # 序列号可通过openssl命令或后台查看，这里先写死做示例:
-    merchant_cert_serial_no = "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
-
-    # url = "https://api.mch.weixin.qq.com/v3/pay/transactions/native"
-    url = f"{MOCK_HOST}/v3/pay/transactions/native"
-
-    # 2. 请求体 JSON
-    amount_dict = {
-        "total": total_fee,        # int类型: 单位分
-        "currency": "CNY"
-    }
-    payer_dict = {
-        # Native支付可能不需要传 payer 里的 openid, 但JSAPI要
-    }
-    data = {
-        "mchid": WECHATPAY_MCHID,
-        "appid": WECHATPAY_APPID,
-        "description": description,
-        "out_trade_no": out_trade_no,
-        "notify_url": "https://www.example.com/wxpay/callback",  # 没有公网也要写
-        "amount": amount_dict,
-    }
-    body_str = json.dumps(data, ensure_ascii=False)
-
-    # 3. 准备请求头
-    authorization = generate_authorization(
-        method="POST",
-        url="/v3/pay/transactions/native",
-        body=body_str,
-        mchid=WECHATPAY_MCHID,
-        serial_no=merchant_cert_serial_no,
-        private_key=private_key
-    )
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": authorization
-    }
-
-    # 4. 发起请求
-    try:
-        resp = requests.post(url, headers=headers, data=body_str, timeout=10)
-        if resp.status_code == 200 or resp.status_code == 201:
-            resp_json = resp.json()
-            # 返回中会包含 code_url
-            return resp_json.get("code_url")
-        else:
-            print("下单接口返回非200:", resp.status_code, resp.text)
-    except Exception as e:
-        print("请求下单接口异常:", e)
-    return None
+    return get_pay_client().unified_order(out_trade_no, total_fee, description)
 
 
 def native_query_order(out_trade_no):
     """
-    V3 查询订单: GET /v3/pay/transactions/out-trade-no/{out_trade_no}?mchid=xxx
+    V3 查询订单，见 PayClient.query_order
     return: 订单状态trade_state, 可能是 SUCCESS, NOTPAY, etc.
     """
-    private_key = load_merchant_private_key(MERCHANT_PRIVATE_KEY_PATH)
-    merchant_cert_serial_no = "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
-    
-    # 1. 拼接URL:
-    path = f"/v3/pay/transactions/out-trade-no/{out_trade_no}?mchid={WECHATPAY_MCHID}"
-    url = "https://api.mch.weixin.qq.com" + path
-    # mock 测试
-    # path = f"/v3/pay/transactions/out-trade-no/{out_trade_no}?mchid=1900000001"
-    # url = MOCK_HOST + path
-
-    # 2. 构造签名(GET请求body为空)
-    authorization = generate_authorization(
-        method="GET",
-        url=path,
-        body="",
-        mchid=WECHATPAY_MCHID,
-        serial_no=merchant_cert_serial_no,
-        private_key=private_key
-    )
-    headers = {
-        "Authorization": authorization
-    }
-
-    # 3. 发起GET请求
-    try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        if resp.status_code == 200:
-            resp_json = resp.json()
-            return resp_json.get("trade_state")  # SUCCESS, NOTPAY, ...
-        else:
-            print("查询订单接口返回:", resp.status_code, resp.text)
-    except Exception as e:
-        print("查询订单接口异常:", e)
-
-    return None
+    return get_pay_client().query_order(out_trade_no)
+
+
+def native_close_order(out_trade_no):
+    """
+    V3 关闭订单，见 PayClient.close_order
+    """
+    return get_pay_client().close_order(out_trade_no)
@@ -0,0 +1,203 @@
+# payment_watcher.py
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from pay_v3 import native_query_order
+
+# 订单到了这些状态就不会再变，停止轮询
+TERMINAL_STATES = {"SUCCESS", "CLOSED", "REVOKED", "PAYERROR", "REFUND"}
+# 本地超时未支付时回调的伪状态(不是微信返回的 trade_state)
+EXPIRED_STATE = "EXPIRED"
+
+
+class PaymentWatcher:
+    """
+    用一个调度线程同时盯住任意多个未完成订单，替代每个订单各自 after() 轮询：
+      - 自适应间隔：刚显示二维码时查得勤(fast_interval)，fast_period 秒后按 backoff 倍数退避到 max_interval
+      - 订单超过 expire_seconds 还没支付就停止轮询，回调 EXPIRED
+      - 状态变化时回调 on_change(out_trade_no, old_state, new_state)
+      - 查询本身放在一个小线程池里，多个订单不会互相排队
+    dispatch: 回调的执行方式，默认在查询线程里直接调用；
+              GUI 里可以传一个把回调转交给 Tk 主线程的函数
+    """
+
+    def __init__(self, query_func=None, fast_interval=1.0, fast_period=20.0, max_interval=5.0,
+                 backoff=1.5, expire_seconds=300, max_workers=4, dispatch=None):
+        self.query_func = query_func or native_query_order
+        self.fast_interval = fast_interval
+        self.fast_period = fast_period
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.expire_seconds = expire_seconds
+        self.max_workers = max_workers
+        self.dispatch = dispatch or (lambda fn: fn())
+
+        self._cond = threading.Condition()
+        # out_trade_no -> 订单的轮询状态
+        self._orders = {}
+        # (到期时间, 序号, out_trade_no)，取消/改期的条目靠 due 对不上来惰性丢弃
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = False
+        self._thread = None
+        self._executor = None
+        self.query_count = 0
+
+    # ---------- 对外接口 ----------
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pay-query")
+            self._thread = threading.Thread(target=self._run, name="payment-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        停止调度线程，丢弃所有未完成订单
+        """
+        with self._cond:
+            self._running = False
+            self._orders.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def watch(self, out_trade_no, on_change=None, expire_seconds=None):
+        """
+        开始盯一个订单，立即查询一次
+        """
+        now = time.monotonic()
+        expire_seconds = self.expire_seconds if expire_seconds is None else expire_seconds
+        with self._cond:
+            previous = self._orders.get(out_trade_no)
+            self._orders[out_trade_no] = {
+                "state": None,
+                "on_change": on_change,
+                "started": now,
+                "expire_at": now + expire_seconds,
+                "interval": self.fast_interval,
+                "due": now,
+                # 重复 watch 时查询可能正在进行，沿用标记，等它返回后再排下一次，避免同一订单并发查两次
+                "in_flight": previous is not None and previous["in_flight"],
+            }
+            heapq.heappush(self._heap, (now, next(self._seq), out_trade_no))
+            self._cond.notify_all()
+        self.start()
+
+    def unwatch(self, out_trade_no):
+        """
+        不再关心这个订单(比如用户取消)，不会再有回调
+        """
+        with self._cond:
+            self._orders.pop(out_trade_no, None)
+
+    def get_state(self, out_trade_no):
+        with self._cond:
+            order = self._orders.get(out_trade_no)
+            return None if order is None else order["state"]
+
+    def pending(self):
+        """
+        还在轮询中的订单号列表
+        """
+        with self._cond:
+            return list(self._orders)
+
+    # ---------- 内部实现 ----------
+
+    def _next_interval(self, order, now):
+        if now - order["started"] < self.fast_period:
+            return self.fast_interval
+        return min(order["interval"] * self.backoff, self.max_interval)
+
+    def _schedule(self, out_trade_no, order, due):
+        order["due"] = due
+        heapq.heappush(self._heap, (due, next(self._seq), out_trade_no))
+        self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            expired = []
+            due_orders = []
+            with self._cond:
+                if not self._running:
+                    return
+                # stop() 会把 self._executor 置为 None，在锁里取一份引用
+                executor = self._executor
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    due, _, trade_no = heapq.heappop(self._heap)
+                    order = self._orders.get(trade_no)
+                    if order is None or order["due"] != due or order["in_flight"]:
+                        continue
+                    if now >= order["expire_at"]:
+                        del self._orders[trade_no]
+                        expired.append((trade_no, order))
+                        continue
+                    order["in_flight"] = True
+                    due_orders.append(trade_no)
+                if not due_orders and not expired:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+
+            for trade_no, order in expired:
+                print(f"订单 {trade_no} 超时未支付，停止轮询")
+                metrics.inc("payment_result", state=EXPIRED_STATE)
+                self._notify(trade_no, order, order["state"], EXPIRED_STATE)
+            for trade_no in due_orders:
+                try:
+                    executor.submit(self._query, trade_no)
+                except RuntimeError:
+                    # stop() 之后线程池已关闭
+                    return
+
+    def _query(self, out_trade_no):
+        try:
+            with metrics.timer("payment_poll"):
+                state = self.query_func(out_trade_no)
+        except Exception as e:
+            print("查询订单异常:", e)
+            state = None
+        metrics.inc("payment_polls", result="error" if state is None else "ok")
+
+        now = time.monotonic()
+        with self._cond:
+            self.query_count += 1
+            order = self._orders.get(out_trade_no)
+            if order is None:
+                return
+            order["in_flight"] = False
+            old_state = order["state"]
+            changed = state is not None and state != old_state
+            if changed:
+                order["state"] = state
+            if state in TERMINAL_STATES:
+                del self._orders[out_trade_no]
+                # 从显示二维码到订单结束的等待时间
+                metrics.observe("payment_wait", now - order["started"])
+                metrics.inc("payment_result", state=state)
+            else:
+                order["interval"] = self._next_interval(order, now)
+                self._schedule(out_trade_no, order, now + order["interval"])
+
+        if changed:
+            self._notify(out_trade_no, order, old_state, state)
+
+    def _notify(self, out_trade_no, order, old_state, new_state):
+        callback = order["on_change"]
+        if callback is None:
+            return
+        self.dispatch(lambda: callback(out_trade_no, old_state, new_state))
@@ -0,0 +1,196 @@
+# print_render.py
+"""
+高分辨率打印渲染：把模板版面(照片框、文字位置、字号)按打印 DPI 等比放大，
+按水平条带逐条渲染并直接流式编码成 PNG，整张大图从不在内存里完整出现，
+峰值内存只和条带高度有关，与 DPI / 纸张大小无关。
+
+    python print_render.py captured.jpg --paper A4 --dpi 300 -o final_print.png
+
+代码里：
+    get_compositor().compose_print(frame, weather_str, "final_print.png", paper="A3")
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+import metrics
+from file_utils import AtomicFile
+from image_utils import format_date_str, get_compositor, load_photo
+
+# 纸张尺寸(毫米，竖版)
+PAPER_SIZES_MM = {
+    "A6": (105, 148),
+    "A5": (148, 210),
+    "A4": (210, 297),
+    "A3": (297, 420),
+}
+PRINT_DPI = 300
+# 每个条带的行数，A4@300dpi 时一条约 1.9MB
+STRIP_HEIGHT = 256
+PNG_COMPRESS_LEVEL = 6
+
+
+def paper_pixels(paper="A4", dpi=PRINT_DPI):
+    """
+    纸张在 dpi 下的像素尺寸 (宽, 高)
+    """
+    if paper not in PAPER_SIZES_MM:
+        raise ValueError(f"未知的纸张尺寸: {paper}")
+    w_mm, h_mm = PAPER_SIZES_MM[paper]
+    return round(w_mm / 25.4 * dpi), round(h_mm / 25.4 * dpi)
+
+
+def fit_scale(template_size, paper="A4", dpi=PRINT_DPI):
+    """
+    模板等比放大到能放进整张纸的倍数
+    """
+    page_w, page_h = paper_pixels(paper, dpi)
+    return min(page_w / template_size[0], page_h / template_size[1])
+
+
+class PngStripWriter:
+    """
+    逐条写入的 PNG 编码器：每个条带压缩后立刻写成一个 IDAT 块，
+    不需要整张图的缓冲区。写到临时文件，close() 时原子地替换目标文件
+    """
+
+    def __init__(self, output_path, width, height, dpi=None, compress_level=PNG_COMPRESS_LEVEL):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._atomic = AtomicFile(output_path)
+        self._file = self._atomic.file
+
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 位 RGB，不隔行
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        if dpi:
+            ppm = round(dpi / 0.0254)
+            self._chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+
+    def _chunk(self, tag, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(tag)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag))))
+
+    def write(self, strip):
+        """
+        写入一个 RGB 条带(PIL Image，宽度必须等于整图宽度)
+        """
+        if strip.width != self.width or strip.mode != "RGB":
+            raise ValueError("条带的宽度或颜色模式与整图不一致")
+        rows = np.asarray(strip)
+        # Sub 滤波：每个像素减去左边的像素(uint8 自然回绕)，照片类图像压缩率明显好于不滤波
+        filtered = np.empty((rows.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        body = filtered[:, 1:].reshape(rows.shape)
+        body[:, 0] = rows[:, 0]
+        np.subtract(rows[:, 1:], rows[:, :-1], out=body[:, 1:])
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self.rows_written != self.height:
+            self.abort()
+            raise ValueError(f"只写入了 {self.rows_written}/{self.height} 行")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+        return self._atomic.commit()
+
+    def abort(self):
+        self._atomic.abort()
+
+
+def _scaled_box(pos, size, sx, sy):
+    x0, y0 = round(pos[0] * sx), round(pos[1] * sy)
+    x1, y1 = round((pos[0] + size[0]) * sx), round((pos[1] + size[1]) * sy)
+    return x0, y0, x1, y1
+
+
+def render_print(photo, weather_str, output_path="final_print.png", paper="A4", dpi=PRINT_DPI,
+                 now_date=None, compositor=None, strip_height=STRIP_HEIGHT,
+                 compress_level=PNG_COMPRESS_LEVEL):
+    """
+    按打印分辨率渲染报纸并逐条写成 PNG，返回输出路径。
+    photo 建议传摄像头的原始帧(分辨率越高，照片区域越清晰)，类型见 load_photo
+    """
+    compositor = compositor or get_compositor()
+    template = compositor.get_template()
+    layout = compositor.get_layout()
+    tw, th = template.size
+    scale = fit_scale(template.size, paper, dpi)
+    width, height = round(tw * scale), round(th * scale)
+    # 取整后两个方向的实际倍数略有不同，分别计算，保证条带边界严格对齐
+    sx, sy = width / tw, height / th
+
+    photo = load_photo(photo)
+    px0, py0, px1, py1 = _scaled_box(layout.photo_pos, layout.photo_size, sx, sy)
+    photo_h_scale = photo.height / (py1 - py0)
+    header, (hx, hy) = compositor.get_header_layer(format_date_str(now_date), weather_str, scale=scale)
+
+    output_path = os.path.splitext(output_path)[0] + ".png"
+    writer = PngStripWriter(output_path, width, height, dpi=dpi, compress_level=compress_level)
+    try:
+        with metrics.timer("print_render"):
+            for y0 in range(0, height, strip_height):
+                y1 = min(height, y0 + strip_height)
+                # 每个条带只放大模板对应的那几行(resize 的 box 参数)，相邻条带之间没有接缝
+                strip = template.resize((width, y1 - y0), Image.BICUBIC,
+                                        box=(0, y0 / sy, tw, min(th, y1 / sy)))
+                a, b = max(y0, py0), min(y1, py1)
+                if a < b:
+                    part = photo.resize((px1 - px0, b - a), Image.BICUBIC,
+                                        box=(0, (a - py0) * photo_h_scale, photo.width,
+                                             min(photo.height, (b - py0) * photo_h_scale)))
+                    strip.paste(part, (px0, a - y0))
+                if hy < y1 and hy + header.height > y0:
+                    strip.paste(header, (hx, hy - y0), header)
+                writer.write(strip)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    print(f"打印图片已生成：{output_path} ({width}x{height}, {paper} @ {dpi}dpi)")
+    return output_path
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按打印分辨率逐条渲染报纸图片")
+    parser.add_argument("photo", help="照片路径")
+    parser.add_argument("-o", "--output", default="final_print.png", help="输出 PNG 路径")
+    parser.add_argument("--paper", default="A4", choices=sorted(PAPER_SIZES_MM), help="纸张尺寸")
+    parser.add_argument("--dpi", type=int, default=PRINT_DPI, help="打印分辨率")
+    parser.add_argument("--weather", default="晴 25℃", help="天气字符串")
+    parser.add_argument("--strip-height", type=int, default=STRIP_HEIGHT, help="每个条带的行数")
+    parser.add_argument("--compress-level", type=int, default=PNG_COMPRESS_LEVEL, help="PNG 压缩级别 0~9")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    render_print(args.photo, args.weather, args.output, paper=args.paper, dpi=args.dpi,
+                 strip_height=args.strip_height, compress_level=args.compress_level)
+    print(f"耗时 {time.perf_counter() - start:.2f}s，峰值内存 {_peak_rss_mb()} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# print_spooler.py
+"""
+后台打印队列：合成好的报纸先放进有上限的队列，立刻返回，
+由工作线程一次性缩放/转换成打印机需要的分辨率和格式，再交给打印后端。
+
+    spooler = get_print_spooler()
+    job = spooler.submit(newspaper)   # 合成好的 PIL Image；队列满时返回 None
+    spooler.stats()                               # 队列深度、完成数、耗时
+
+后端只需要实现 submit(image, job, copy_no)，每次调用只打一份，多份由队列循环提交：
+  - FileDropBackend：写到一个目录(打印机驱动/外部程序监视的热文件夹)，测试也用它
+  - CommandBackend：写临时文件后调用系统打印命令，如 ["lp", "{path}"]
+"""
+import itertools
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+from PIL import Image
+
+import metrics
+from image_utils import OutputEncoder, save_image_atomic
+
+# 打印机的像素尺寸：A6(105x148mm) @ 300dpi
+PRINT_SIZE = (1240, 1748)
+# 打印机接受的颜色模式，黑白热敏打印机可改为 "L"
+PRINT_MODE = "RGB"
+PRINT_BACKGROUND = "white"
+# 最多排队多少张，满了之后新的打印请求直接拒绝，不拖住界面
+MAX_QUEUE = 8
+PRINT_SPOOL_DIR = "print_spool"
+# stats() 里统计耗时用的最近任务数
+LATENCY_WINDOW = 100
+# shutdown(wait=False) 等正在写的那一份写完(或放弃)的最长秒数，
+# 超时后进程退出时工作线程(daemon)会被直接结束，留下的临时文件由下次启动时清理
+STOP_TIMEOUT = 2.0
+
+
+class PrintCancelled(Exception):
+    """
+    打印队列停止时，正在处理的任务在两份之间被取消
+    """
+
+
+def prepare_for_print(image, size=PRINT_SIZE, mode=PRINT_MODE, background=PRINT_BACKGROUND):
+    """
+    等比缩放到打印尺寸内并居中放在纸张大小的画布上，只做一次缩放和一次颜色转换
+    """
+    scale = min(size[0] / image.width, size[1] / image.height)
+    fitted = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if fitted != image.size:
+        image = image.resize(fitted, Image.LANCZOS)
+    if image.mode != mode:
+        image = image.convert(mode)
+    if fitted == tuple(size):
+        return image
+    page = Image.new(mode, size, background)
+    page.paste(image, ((size[0] - fitted[0]) // 2, (size[1] - fitted[1]) // 2))
+    return page
+
+
+class PrintJob:
+    """
+    一次打印任务，状态：queued -> printing -> done / failed / cancelled
+    """
+
+    def __init__(self, job_id, source, copies=1, on_done=None):
+        self.job_id = job_id
+        # 报纸图片路径或 PIL Image
+        self.source = source
+        self.copies = copies
+        self.on_done = on_done
+        self.status = "queued"
+        self.error = None
+        self.output = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    @property
+    def wait_seconds(self):
+        """
+        在队列里等待的时间
+        """
+        if self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def latency(self):
+        """
+        从提交到打印后端完成的总耗时
+        """
+        if self.finished is None:
+            return None
+        return self.finished - self.submitted
+
+    def __repr__(self):
+        return f"PrintJob({self.job_id}, {self.status})"
+
+
+class FileDropBackend:
+    """
+    把转换好的图片原子地写到 directory 下，文件名为 job_<编号>_<第几份>.<扩展名>；
+    启动时删除上次进程写到一半被结束留下的临时文件(.tmp_*)
+    """
+
+    def __init__(self, directory=PRINT_SPOOL_DIR, output_encoder=None):
+        self.directory = directory
+        # 打印用的图片不需要高压缩，优先编码速度
+        self.output_encoder = output_encoder or OutputEncoder("PNG", png_compress_level=1)
+        os.makedirs(directory, exist_ok=True)
+        self.remove_stale_tmp()
+
+    def remove_stale_tmp(self):
+        """
+        删除目录里的临时文件(原子写入的中间文件，正常情况下写完就被改名或删除)
+        """
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.startswith(".tmp_"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            print(f"清理打印目录里的 {removed} 个临时文件")
+        return removed
+
+    def submit(self, image, job, copy_no=1):
+        path = os.path.join(self.directory, f"job_{job.job_id:06d}_{copy_no}{self.output_encoder.extension}")
+        save_image_atomic(image, path, **self.output_encoder.save_kwargs())
+        return path
+
+
+class CommandBackend:
+    """
+    写临时文件后调用系统打印命令，command 中的 "{path}" 会替换成文件路径，如 ["lp", "{path}"]；
+    命令只打一份(份数由队列循环控制，不要在命令里再指定)，返回非 0 视为失败
+    """
+
+    def __init__(self, command, output_encoder=None, timeout=60):
+        self.command = list(command)
+        self.output_encoder = output_encoder or OutputEncoder("PNG", png_compress_level=1)
+        self.timeout = timeout
+
+    def submit(self, image, job, copy_no=1):
+        fd, path = tempfile.mkstemp(prefix=f"print_{job.job_id}_{copy_no}_", suffix=self.output_encoder.extension)
+        os.close(fd)
+        try:
+            self.output_encoder.save(image, path)
+            args = [a.format(path=path) for a in self.command]
+            subprocess.run(args, check=True, timeout=self.timeout,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        finally:
+            os.remove(path)
+        return " ".join(self.command)
+
+
+class PrintSpooler:
+    """
+    有上限的打印队列 + 单个工作线程(打印机本身就是串行的)
+    """
+
+    def __init__(self, backend=None, print_size=PRINT_SIZE, print_mode=PRINT_MODE, max_queue=MAX_QUEUE):
+        self.backend = backend or FileDropBackend()
+        self.print_size = tuple(print_size)
+        self.print_mode = print_mode
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._thread = None
+        # shutdown(wait=False) 后置位，正在处理的任务不再提交剩下的份数
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="print-spooler", daemon=True)
+                self._thread.start()
+
+    def submit(self, source, copies=1, on_done=None):
+        """
+        提交一张报纸(PIL Image 或路径)，不阻塞。
+        路径只在轮到该任务时才读取，排队期间文件不能被覆盖；界面和命令行都直接提交合成好的图片
+        on_done(job) 在工作线程里回调(成功或失败都会调用)；
+        return: PrintJob，队列已满时返回 None
+        """
+        self.start()
+        job = PrintJob(next(self._ids), source, copies, on_done)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            metrics.inc("print_jobs", result="rejected")
+            print("打印队列已满，请稍后再试")
+            return None
+        metrics.set_gauge("print_queue_depth", self._queue.qsize())
+        print(f"打印任务 {job.job_id} 已加入队列(排队 {self._queue.qsize()} 张)")
+        return job
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _load(self, source):
+        if isinstance(source, Image.Image):
+            return source
+        with Image.open(source) as im:
+            im.load()
+            return im
+
+    def _process(self, job):
+        job.status = "printing"
+        job.started = time.monotonic()
+        try:
+            with metrics.timer("print_convert"):
+                page = prepare_for_print(self._load(job.source), self.print_size, self.print_mode)
+            # 转换一次，多份只重复提交，每次提交一份
+            with metrics.timer("print_submit"):
+                for copy_no in range(1, job.copies + 1):
+                    if self._stopping.is_set():
+                        raise PrintCancelled(f"打印队列已停止，第 {copy_no} 份起未打印")
+                    job.output = self.backend.submit(page, job, copy_no)
+            job.status = "done"
+        except PrintCancelled as e:
+            job.status = "cancelled"
+            job.error = e
+            print(f"打印任务 {job.job_id} 已取消:", e)
+        except Exception as e:
+            job.status = "failed"
+            job.error = e
+            print(f"打印任务 {job.job_id} 失败:", e)
+        job.finished = time.monotonic()
+        # 图片已经交给后端，不再持有
+        job.source = None
+
+        with self._lock:
+            if job.status == "done":
+                self.completed += 1
+                self._latencies.append(job.latency)
+            elif job.status == "cancelled":
+                self.cancelled += 1
+            else:
+                self.failed += 1
+        metrics.inc("print_jobs", result=job.status)
+        metrics.observe("print_job", job.latency)
+        metrics.set_gauge("print_queue_depth", self._queue.qsize())
+        if job.status == "done":
+            print(f"打印任务 {job.job_id} 完成，耗时 {job.latency * 1000:.0f} ms -> {job.output}")
+
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                print("打印回调异常:", e)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._process(job)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """
+        等待队列里的任务全部处理完
+        """
+        self._queue.join()
+
+    def shutdown(self, wait=True):
+        """
+        停止工作线程；wait=True 时先把已排队的任务打完。
+        wait=False 时丢弃还没开始的任务，正在处理的任务写完当前这一份就取消，
+        最多等 STOP_TIMEOUT 秒，不会因为进程退出在打印目录里留下临时文件
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        if not wait:
+            self._stopping.set()
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job.status = "cancelled"
+                    with self._lock:
+                        self.cancelled += 1
+                self._queue.task_done()
+        self._queue.put(None)
+        thread.join(None if wait else STOP_TIMEOUT)
+
+    def stats(self):
+        """
+        队列深度、完成/失败/拒绝/取消数以及最近任务的平均和最大耗时(ms)
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result = {
+                "queue_depth": self._queue.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+            }
+        result["avg_latency_ms"] = round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None
+        result["max_latency_ms"] = round(latencies[-1] * 1000, 1) if latencies else None
+        return result
+
+
+_default_spooler = None
+_default_spooler_lock = threading.Lock()
+
+
+def get_print_spooler():
+    """
+    获取进程内共享的打印队列(懒加载)
+    """
+    global _default_spooler
+    if _default_spooler is None:
+        with _default_spooler_lock:
+            if _default_spooler is None:
+                _default_spooler = PrintSpooler()
+    return _default_spooler
@@ -0,0 +1,80 @@
+# qr_utils.py
+"""
+支付二维码：完全在内存里生成，直接得到界面显示大小(QR_SIZE)的图片，不写 pay_qr.png。
+  - 用 qrcode 只算出模块矩阵，再用 NumPy 按整数倍放大(每个模块边长相同，扫码更稳)，
+    居中放到 QR_SIZE 的白底上，不需要再缩放
+  - 按 code_url 做 LRU 缓存，同一个待支付订单再次显示时直接取缓存
+  - 生成耗时记在 metrics 的 qr_render 里，缓存命中情况记在 qr_cache{result} 里
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+import metrics
+
+# 二维码 Label 的大小
+QR_SIZE = (200, 200)
+# 静区(白边)的模块数，标准要求 4
+QR_BORDER = 4
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_M
+# 缓存多少个订单的二维码(每个约 40KB)
+QR_CACHE_SIZE = 8
+
+# (code_url, 大小) -> 二维码图片(灰度，只读)
+_qr_cache = OrderedDict()
+_qr_lock = threading.Lock()
+
+
+def render_qr(code_url, size=QR_SIZE, border=QR_BORDER):
+    """
+    生成 code_url 的二维码，返回恰好 size 大小的灰度 PIL Image
+    """
+    qr = qrcode.QRCode(error_correction=QR_ERROR_CORRECTION, border=border)
+    qr.add_data(code_url)
+    qr.make(fit=True)
+    # True 为黑色模块，已经包含静区
+    matrix = np.asarray(qr.get_matrix(), dtype=bool)
+    modules = matrix.shape[0]
+    box = min(size) // modules
+    if box < 1:
+        raise ValueError(f"{size} 放不下 {modules}x{modules} 个模块的二维码")
+
+    pixels = np.where(matrix, 0, 255).astype(np.uint8)
+    pixels = pixels.repeat(box, axis=0).repeat(box, axis=1)
+    canvas = np.full((size[1], size[0]), 255, dtype=np.uint8)
+    x = (size[0] - pixels.shape[1]) // 2
+    y = (size[1] - pixels.shape[0]) // 2
+    canvas[y:y + pixels.shape[0], x:x + pixels.shape[1]] = pixels
+    return Image.fromarray(canvas)
+
+
+def get_qr_image(code_url, size=QR_SIZE):
+    """
+    取 code_url 的二维码(LRU 缓存)，没有就生成一次。返回的图片是共享的，不要在上面画
+    """
+    key = (code_url, tuple(size))
+    with _qr_lock:
+        image = _qr_cache.get(key)
+        if image is not None:
+            _qr_cache.move_to_end(key)
+    if image is not None:
+        metrics.inc("qr_cache", result="hit")
+        return image
+
+    metrics.inc("qr_cache", result="miss")
+    with metrics.timer("qr_render"):
+        image = render_qr(code_url, size)
+    with _qr_lock:
+        _qr_cache[key] = image
+        _qr_cache.move_to_end(key)
+        while len(_qr_cache) > QR_CACHE_SIZE:
+            _qr_cache.popitem(last=False)
+    return image
+
+
+def clear_qr_cache():
+    with _qr_lock:
+        _qr_cache.clear()
@@ -0,0 +1,275 @@
+# render_server.py
+"""
+报纸渲染服务：多台 kiosk 共用一台渲染机。
+
+    POST /render     multipart 上传 photo(或直接把图片作为请求体)，
+                     可选参数 weather / date(YYYY-MM-DD) / format(png, png-fast, jpeg, webp)
+                     返回合成好的报纸图片
+    GET  /render/stats   队列和吞吐统计
+    GET  /metrics        Prometheus 指标(--metrics 开启时有数据)
+
+    python render_server.py --port 8010 --workers 4 --queue 8
+
+模板常驻内存；合成在固定大小的线程池里进行，排队的请求数有上限，
+满了直接返回 429(带 Retry-After)，kiosk 可以退回本机合成。
+编码完成后立即释放工作线程，响应按块流式写回，慢客户端不会占住渲染名额。
+"""
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from flask import Flask, Response, request, jsonify
+
+import metrics
+import server_utils
+from image_utils import OUTPUT_PRESETS, create_compositor
+
+app = Flask(__name__)
+
+# 同时合成的线程数(建议等于渲染机的 CPU 核数)
+RENDER_WORKERS = os.cpu_count() or 2
+# 除正在合成的请求外，最多还能排队多少个
+RENDER_QUEUE = 8
+# 单个请求最多等待多久(秒)
+RENDER_TIMEOUT = 30
+# 请求里没带天气时，取天气最多等多久(秒)；本地没有缓存又取不到时用默认天气
+WEATHER_TIMEOUT = 2
+RENDER_BACKEND = "cv"
+RENDER_FORMAT = "jpeg"
+# 上传照片的大小上限
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# 模拟 kiosk 与渲染机之间的网络延迟(秒)，压测用
+MOCK_LATENCY = 0.0
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+
+class PhotoDecodeError(ValueError):
+    """
+    上传的照片无法解码(客户端的问题，返回 400)
+    """
+
+
+def resolve_weather(weather_str):
+    """
+    请求没带天气时从天气缓存取：缓存为空时最多等 WEATHER_TIMEOUT 秒(刷新本身在天气缓存的线程池里，
+    超时后继续在后台进行)，取不到用默认天气，不会长时间占住渲染名额
+    """
+    if weather_str:
+        return weather_str
+    from weather_utils import get_weather_cache
+    return get_weather_cache().get_weather_str(timeout=WEATHER_TIMEOUT)
+
+
+class RenderPool:
+    """
+    有上限的合成线程池：workers 个同时合成，最多再排队 queue_size 个，超出时 try_submit 返回 None
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, queue_size=RENDER_QUEUE, backend=RENDER_BACKEND):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.compositor = create_compositor(backend)
+        # 预先加载模板和字体，第一个请求不用等
+        self.compositor.get_template()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.in_system = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.render_seconds = 0.0
+
+    def _render(self, photo_bytes, weather_str, now_date, output_encoder):
+        # 天气在拿到名额之后才取，缓存为空时也不会拖住马上要被 429 拒绝的请求
+        weather_str = resolve_weather(weather_str)
+        # avg_render_ms 只统计解码 + 合成 + 编码，不含等天气
+        start = time.perf_counter()
+        try:
+            photo = self.compositor.decode_photo(io.BytesIO(photo_bytes))
+        except Exception as e:
+            raise PhotoDecodeError(f"无法解码上传的照片: {e}") from e
+        data = self.compositor.render_bytes(photo, weather_str, now_date=now_date, output_encoder=output_encoder)
+        with self._lock:
+            self.render_seconds += time.perf_counter() - start
+        return data
+
+    def _release(self, future):
+        # 请求超时放弃等待时，名额也要等合成真正结束才归还
+        with self._lock:
+            self.in_system -= 1
+            if future.exception() is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+        metrics.set_gauge("render_in_system", self.in_system)
+
+    def try_submit(self, photo_bytes, weather_str, now_date, output_encoder):
+        """
+        return: Future(结果为编码后的字节)；已饱和时返回 None
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            self.in_system += 1
+        metrics.set_gauge("render_in_system", self.in_system)
+        future = self._executor.submit(self._render, photo_bytes, weather_str, now_date, output_encoder)
+        future.add_done_callback(self._release)
+        return future
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_system": self.in_system,
+                "queued": max(0, self.in_system - self.workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_render_ms": round(self.render_seconds / done * 1000, 2) if done else None,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool()
+    return _pool
+
+
+def _iter_chunks(data):
+    view = memoryview(data)
+    for start in range(0, len(view), STREAM_CHUNK_SIZE):
+        yield view[start:start + STREAM_CHUNK_SIZE].tobytes()
+
+
+@app.before_request
+def simulate_latency():
+    if MOCK_LATENCY > 0:
+        time.sleep(MOCK_LATENCY)
+
+
+@app.route("/render", methods=["POST"])
+def render_newspaper():
+    upload = request.files.get("photo")
+    photo_bytes = upload.read() if upload is not None else request.get_data()
+    if not photo_bytes:
+        return jsonify({"error": "missing photo"}), 400
+
+    weather_str = request.values.get("weather")
+    now_date = None
+    if request.values.get("date"):
+        try:
+            now_date = datetime.strptime(request.values["date"], "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": "invalid date, expected YYYY-MM-DD"}), 400
+    fmt = request.values.get("format", RENDER_FORMAT)
+    encoder = OUTPUT_PRESETS.get(fmt)
+    if encoder is None:
+        return jsonify({"error": f"unknown format, expected one of {sorted(OUTPUT_PRESETS)}"}), 400
+
+    pool = get_render_pool()
+    future = pool.try_submit(photo_bytes, weather_str, now_date, encoder)
+    if future is None:
+        metrics.inc("render_requests", result="rejected")
+        resp = jsonify({"error": "render queue full"})
+        resp.headers["Retry-After"] = "1"
+        return resp, 429
+
+    try:
+        with metrics.timer("render_request"):
+            data = future.result(timeout=RENDER_TIMEOUT)
+    except FutureTimeoutError:
+        metrics.inc("render_requests", result="timeout")
+        return jsonify({"error": "render timeout"}), 503
+    except PhotoDecodeError as e:
+        metrics.inc("render_requests", result="bad_photo")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        metrics.inc("render_requests", result="error")
+        return jsonify({"error": f"render failed: {e}"}), 500
+    metrics.inc("render_requests", result="ok")
+
+    return Response(_iter_chunks(data), mimetype=MIME_TYPES[encoder.format],
+                    headers={"Content-Length": str(len(data))})
+
+
+@app.route("/render/stats", methods=["GET"])
+def render_stats():
+    return jsonify(get_render_pool().stats()), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def render_metrics():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def render_remote(url, photo_bytes, weather_str=None, now_date=None, fmt=RENDER_FORMAT, timeout=RENDER_TIMEOUT,
+                  session=None):
+    """
+    kiosk 端调用：把照片(已编码的字节，如 JPEG)发给渲染服务。
+    return: 图片字节；服务饱和(429)或出错时返回 None，调用方可退回本机合成
+    """
+    import requests
+
+    data = {"format": fmt}
+    if weather_str:
+        data["weather"] = weather_str
+    if now_date is not None:
+        data["date"] = now_date.strftime("%Y-%m-%d")
+    try:
+        resp = (session or requests).post(f"{url}/render", files={"photo": ("photo.jpg", photo_bytes)},
+                                          data=data, timeout=timeout)
+        if resp.status_code == 200:
+            return resp.content
+        print("渲染服务返回:", resp.status_code, resp.text[:200])
+    except Exception as e:
+        print("请求渲染服务异常:", e)
+    return None
+
+
+def start_in_thread(host="127.0.0.1", port=8010):
+    """
+    在当前进程的后台线程里启动渲染服务，返回 werkzeug server，用完调用 server.shutdown()
+    """
+    return server_utils.start_in_thread(app, host, port, name="render-server")
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="报纸渲染服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS, help="同时合成的线程数")
+    parser.add_argument("--queue", type=int, default=RENDER_QUEUE, help="最多排队的请求数，超出返回 429")
+    parser.add_argument("--backend", default=RENDER_BACKEND, choices=("pil", "cv"), help="合成后端")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求额外等待的毫秒数")
+    parser.add_argument("--metrics", action="store_true", help="开启埋点，/metrics 输出各阶段耗时")
+    parser.add_argument("--quiet", action="store_true", help="关闭请求日志(压测用)")
+    args = parser.parse_args()
+    MOCK_LATENCY = args.latency_ms / 1000
+    if args.metrics:
+        metrics.enable()
+    _pool = RenderPool(workers=args.workers, queue_size=args.queue, backend=args.backend)
+
+    if args.quiet:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app.run(host=args.host, port=args.port, debug=False, threaded=True)
@@ -0,0 +1,53 @@
+# server_utils.py
+"""
+本地起服务的公共函数(压测、基准测试用)，fake_server、fake_weather_server、render_server 共用：
+  - start_in_thread：在当前进程的后台线程里跑 Flask app
+  - spawn_process：以独立进程启动服务脚本(不和压测客户端抢 GIL)，端口可连接后返回
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# 服务脚本所在目录，spawn_process 的相对路径按这里解析，不依赖当前工作目录
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_in_thread(app, host="127.0.0.1", port=8000, name="server"):
+    """
+    在后台线程里启动 app，返回 werkzeug server，用完调用 server.shutdown()
+    """
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True)
+    t = threading.Thread(target=server.serve_forever, name=name, daemon=True)
+    t.start()
+    return server
+
+
+def spawn_process(script, host="127.0.0.1", port=8000, latency_ms=0, wait=10.0, extra_args=()):
+    """
+    以独立进程启动服务脚本，端口可连接后返回 Popen，用完调用 proc.terminate()。
+    script 是相对本目录的文件名(如 "render_server.py")或绝对路径，
+    脚本需支持 --host/--port/--latency-ms/--quiet，extra_args 追加到命令行末尾
+    """
+    script = os.path.join(SCRIPT_DIR, script)
+    proc = subprocess.Popen(
+        [sys.executable, script, "--host", host, "--port", str(port),
+         "--latency-ms", str(latency_ms), "--quiet", *extra_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    name = os.path.basename(script)
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} 启动失败")
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"{name} 启动超时")
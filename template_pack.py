@@ -0,0 +1,198 @@
+# template_pack.py
+"""
+预编译的模板包：一个 JSON 元数据文件(照片框、文字位置和内容、字体)
+加上一个解码好的原始 RGB 像素文件(H x W x 3 字节，无文件头)。
+
+加载时像素文件用 mmap 映射，不解码 PNG，多个进程映射同一个文件时共享操作系统的页缓存；
+同一进程内按路径缓存，切换模板只是换一个引用。
+
+编译：
+    python template_pack.py resource/newspaper_template.png
+    python template_pack.py other.png -o resource/templates/spring.json --photo-box 100,200,600,450
+
+编译结果默认放在 resource/templates/<名字>.json + <名字>.rgb；
+NewspaperCompositor 加载 PNG 模板时，如果这里有对应且未过期的模板包，会自动改用模板包。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+from PIL import Image
+
+from image_utils import TEMPLATE_PACK_DIR, TemplateLayout, write_bytes_atomic
+
+PACK_FORMAT_VERSION = 1
+
+# abspath -> (元数据 mtime, TemplatePack)
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+class TemplatePack:
+    """
+    一个已编译的模板：layout(版面) + pixels(只读的 RGB 内存映射，H x W x 3)
+    """
+
+    def __init__(self, meta_path):
+        self.meta_path = meta_path
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != PACK_FORMAT_VERSION:
+            raise ValueError(f"不支持的模板包版本: {meta.get('format')}")
+        self.name = meta["name"]
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.source = meta.get("source")
+        self.source_mtime = meta.get("source_mtime")
+        self.layout = TemplateLayout.from_dict(meta["layout"])
+        pixels_path = os.path.join(os.path.dirname(meta_path), meta["pixels"])
+        expected = self.width * self.height * 3
+        if os.path.getsize(pixels_path) != expected:
+            raise ValueError(f"像素文件大小不对: {pixels_path}")
+        # 用到模板包时才导入 numpy，只用 PNG 模板的 PIL 路径不依赖它
+        import numpy as np
+
+        self.pixels = np.memmap(pixels_path, dtype=np.uint8, mode="r", shape=(self.height, self.width, 3))
+        self._image = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def image(self):
+        """
+        PIL 版的模板(只读)，第一次用到时生成。
+        PIL 内部每像素占 4 字节，无法直接映射 3 字节的 RGB，所以这里有一次拷贝(不解码)；
+        只用 ndarray 的 cv 后端完全不经过这一步
+        """
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    self._image = Image.frombuffer("RGB", self.size, self.pixels, "raw", "RGB", 0, 1)
+        return self._image
+
+
+def is_template_pack(path):
+    return str(path).lower().endswith(".json")
+
+
+def load_template_pack(meta_path):
+    """
+    加载模板包(同一进程内按路径缓存，元数据文件更新后重新加载)
+    """
+    key = os.path.abspath(meta_path)
+    mtime = os.path.getmtime(meta_path)
+    with _packs_lock:
+        cached = _packs.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    pack = TemplatePack(meta_path)
+    with _packs_lock:
+        _packs[key] = (mtime, pack)
+    return pack
+
+
+def clear_template_pack_cache():
+    with _packs_lock:
+        _packs.clear()
+
+
+def default_pack_path(png_path, pack_dir=None):
+    return os.path.join(pack_dir or TEMPLATE_PACK_DIR, os.path.splitext(os.path.basename(png_path))[0] + ".json")
+
+
+def find_compiled_pack(png_path, pack_dir=None):
+    """
+    png_path 对应的模板包存在且是用当前版本的 PNG 编译的，返回其路径，否则返回 None
+    """
+    meta_path = default_pack_path(png_path, pack_dir)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != PACK_FORMAT_VERSION or meta.get("source_mtime") != os.path.getmtime(png_path):
+        return None
+    return meta_path
+
+
+def compile_template(png_path, meta_path=None, layout=None):
+    """
+    把 PNG 模板编译成模板包，return: 元数据文件路径
+    layout 为空时使用默认版面(image_utils 里的坐标常量)
+    """
+    meta_path = meta_path or default_pack_path(png_path)
+    layout = layout or TemplateLayout()
+    out_dir = os.path.dirname(os.path.abspath(meta_path))
+    os.makedirs(out_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(meta_path))[0]
+    pixels_name = name + ".rgb"
+
+    with Image.open(png_path) as im:
+        rgb = im.convert("RGB")
+    px, py = layout.photo_pos
+    pw, ph = layout.photo_size
+    if px < 0 or py < 0 or px + pw > rgb.width or py + ph > rgb.height:
+        raise ValueError(f"照片框 {layout.photo_pos}+{layout.photo_size} 超出模板范围 {rgb.size}")
+
+    # 先写像素再写元数据：读到新元数据时像素一定已经就位
+    write_bytes_atomic(rgb.tobytes(), os.path.join(out_dir, pixels_name))
+    meta = {
+        "format": PACK_FORMAT_VERSION,
+        "name": name,
+        "width": rgb.width,
+        "height": rgb.height,
+        "pixels": pixels_name,
+        "source": os.path.relpath(os.path.abspath(png_path), out_dir),
+        "source_mtime": os.path.getmtime(png_path),
+        "layout": layout.to_dict(),
+    }
+    write_bytes_atomic(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"), meta_path)
+    return meta_path
+
+
+def _parse_box(text):
+    values = [int(v) for v in text.split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("格式应为 x,y,宽,高")
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把 PNG 模板编译成模板包(JSON 元数据 + mmap 像素)")
+    parser.add_argument("template", nargs="+", help="PNG 模板路径，可以有多个")
+    parser.add_argument("-o", "--output", default=None, help="元数据输出路径(只编译一个模板时可用)")
+    parser.add_argument("--layout", default=None, help="版面 JSON 文件(格式同模板包里的 layout 字段)")
+    parser.add_argument("--photo-box", type=_parse_box, default=None, help="照片框 x,y,宽,高")
+    parser.add_argument("--font", default=None, help="字体路径")
+    parser.add_argument("--font-size", type=int, default=None, help="字号")
+    args = parser.parse_args(argv)
+    if args.output and len(args.template) > 1:
+        parser.error("编译多个模板时不能指定 -o")
+
+    layout = TemplateLayout()
+    if args.layout:
+        with open(args.layout, "r", encoding="utf-8") as f:
+            layout = TemplateLayout.from_dict(json.load(f))
+    if args.photo_box:
+        x, y, w, h = args.photo_box
+        layout.photo_pos, layout.photo_size = (x, y), (w, h)
+    if args.font:
+        layout.font_path = args.font
+    if args.font_size:
+        layout.font_size = args.font_size
+
+    for png_path in args.template:
+        meta_path = compile_template(png_path, args.output, layout)
+        print(f"已编译 {png_path} -> {meta_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
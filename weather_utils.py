@@ -4,13 +4,28 @@
 # from PIL import Image, ImageTk
 import os
 import json
+import threading
+import time
 import requests
+import requests.adapters
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+
+import metrics
+from file_utils import atomic_write
 # from PIL import ImageDraw, ImageFont
 
 WEATHER_API_KEY = "key" # 你的高德地图天气API Key
 WEATHER_CITY = "210202"
+# 多个 kiosk 分布在不同区时，在这里列出所有需要的城市编码(第一个为默认城市)
+WEATHER_CITIES = [WEATHER_CITY]
 LOCAL_WEATHER_JSON = "resource/weather_result.json"
+WEATHER_API_URL = "https://restapi.amap.com/v3/weather/weatherInfo"
+# 天气数据的有效期(按 reporttime 计算)
+WEATHER_TTL = timedelta(hours=1)
+# 刷新失败或接口返回的数据本身就旧时，两次请求之间至少间隔多少秒
+MIN_REFRESH_INTERVAL = 60
+DEFAULT_WEATHER_STR = "晴 25℃"
 
 def extract_weather_str(data_dict):
     """
@@ -23,49 +38,272 @@ def extract_weather_str(data_dict):
     temperature = lives[0].get("temperature","0")
     return f"{weather_desc} {temperature}℃"
 
-def get_weather_info():
+def write_json_atomic(path, data):
+    """
+    先写临时文件再 os.replace，其他进程不会读到写了一半的 JSON
+    """
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+class _CityEntry:
+    """
+    单个城市的缓存条目
+    """
+
+    def __init__(self, city, json_path, ttl):
+        self.city = city
+        self.json_path = json_path
+        self.ttl = ttl
+        self.data = None
+        self.weather_str = None
+        self.report_time = None
+        self.loaded = False
+        self.last_attempt = None
+        # 正在进行的刷新，完成时 set；None 表示当前没有刷新
+        self.refresh_done = None
+
+
+class WeatherCache:
     """
-    获取天气信息，逻辑与之前相同
+    进程内的天气缓存(stale-while-revalidate)，按城市编码(adcode)分别缓存：
+      - 解析后的天气数据常驻内存，不再每次打开、解析 weather_result.json
+      - 数据过期时立即返回旧数据，同时在后台线程刷新
+      - 同一城市并发的刷新请求合并成一次；多个城市通过连接池并发请求
+      - 每个城市可以单独设置有效期(city_ttls)
+      - 刷新结果原子地写回本地 JSON(默认城市仍是 weather_result.json)
     """
-    local_data = None
-    if os.path.exists(LOCAL_WEATHER_JSON):
+
+    def __init__(self, cities=None, json_path=LOCAL_WEATHER_JSON, api_key=WEATHER_API_KEY,
+                 ttl=WEATHER_TTL, min_refresh_interval=MIN_REFRESH_INTERVAL, city_ttls=None,
+                 api_url=WEATHER_API_URL, max_workers=4, city=None):
+        # city 参数保留给只关心一个城市的旧用法
+        cities = list(cities or [city or WEATHER_CITY])
+        self.default_city = cities[0]
+        self.json_path = json_path
+        self.api_key = api_key
+        self.api_url = api_url
+        self.ttl = ttl
+        self.city_ttls = dict(city_ttls or {})
+        self.min_refresh_interval = min_refresh_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        for c in cities:
+            self._entry(c)
+
+        # 所有城市共用一个带连接池的 Session，并发请求时复用连接
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weather")
+
+    @property
+    def cities(self):
+        with self._lock:
+            return list(self._entries)
+
+    def json_path_for(self, city):
+        """
+        默认城市沿用 weather_result.json，其他城市写到 weather_result_<adcode>.json
+        """
+        if city == self.default_city:
+            return self.json_path
+        root, ext = os.path.splitext(self.json_path)
+        return f"{root}_{city}{ext}"
+
+    def _entry(self, city):
+        """
+        取(或创建)城市的缓存条目(调用方持有锁，或在 __init__ 中)
+        """
+        entry = self._entries.get(city)
+        if entry is None:
+            entry = _CityEntry(city, self.json_path_for(city), self.city_ttls.get(city, self.ttl))
+            self._entries[city] = entry
+        return entry
+
+    def _set_data(self, entry, data):
+        """
+        更新内存中的数据(调用方持有锁)
+        """
+        report_time = None
         try:
-            with open(LOCAL_WEATHER_JSON, "r", encoding="utf-8") as f:
-                local_data = json.load(f)
+            report_time = datetime.strptime(data["lives"][0]["reporttime"], "%Y-%m-%d %H:%M:%S")
         except Exception as e:
-            print("读取本地 weather_result.json 失败：", e)
-            local_data = None
+            print("解析天气数据的 reporttime 出现异常:", e)
+        entry.data = data
+        entry.weather_str = extract_weather_str(data)
+        entry.report_time = report_time
 
-    if local_data:
+    def _load_local(self, entry):
+        """
+        首次使用时读取一次本地 JSON(调用方持有锁)
+        """
+        entry.loaded = True
+        if not os.path.exists(entry.json_path):
+            print(f"未找到本地 {os.path.basename(entry.json_path)}，调用API获取最新数据。")
+            return
         try:
-            lives_info = local_data["lives"][0]
-            report_time_str = lives_info["reporttime"]  # "2025-02-27 14:02:16"
-            report_time = datetime.strptime(report_time_str, "%Y-%m-%d %H:%M:%S")
-            if datetime.now() - report_time <= timedelta(hours=1):
-                print("本地天气数据未超过1小时，直接使用本地数据。")
-                return extract_weather_str(local_data)
-            else:
-                print("本地天气数据超过1小时，调用API更新。")
+            with open(entry.json_path, "r", encoding="utf-8") as f:
+                self._set_data(entry, json.load(f))
         except Exception as e:
-            print("解析本地天气数据时出现异常，调用API更新:", e)
-    else:
-        print("未找到本地 weather_result.json，调用API获取最新数据。")
-
-    url = f"https://restapi.amap.com/v3/weather/weatherInfo?city={WEATHER_CITY}&key={WEATHER_API_KEY}"
-    try:
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("status") == "1" and "lives" in data and len(data["lives"]) > 0:
-                with open(LOCAL_WEATHER_JSON, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
-                return extract_weather_str(data)
-            else:
+            print(f"读取本地 {os.path.basename(entry.json_path)} 失败：", e)
+
+    def _is_fresh(self, entry):
+        return entry.report_time is not None and datetime.now() - entry.report_time <= entry.ttl
+
+    def _can_refresh(self, entry):
+        return entry.last_attempt is None or time.monotonic() - entry.last_attempt >= self.min_refresh_interval
+
+    def _fetch(self, city):
+        """
+        请求高德天气接口，成功返回数据字典，失败返回 None
+        """
+        try:
+            response = self.session.get(self.api_url, params={"city": city, "key": self.api_key}, timeout=5)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("status") == "1" and "lives" in data and len(data["lives"]) > 0:
+                    return data
                 print("API返回数据异常，无法提取有效天气信息:", data)
-                return "晴 25℃"
-        else:
-            print("API请求失败，status_code:", response.status_code)
-            return "晴 25℃"
-    except Exception as e:
-        print("请求天气API出现错误:", e)
-        return "晴 25℃"
+            else:
+                print("API请求失败，status_code:", response.status_code)
+        except Exception as e:
+            print("请求天气API出现错误:", e)
+        return None
+
+    def _refresh(self, entry, done):
+        with metrics.timer("weather_fetch"):
+            data = self._fetch(entry.city)
+        metrics.inc("weather_refresh", result="ok" if data is not None else "error")
+        if data is not None:
+            try:
+                write_json_atomic(entry.json_path, data)
+            except Exception as e:
+                print(f"写入本地 {os.path.basename(entry.json_path)} 失败：", e)
+        with self._lock:
+            if data is not None:
+                self._set_data(entry, data)
+            entry.refresh_done = None
+        done.set()
+
+    def _start_refresh(self, entry):
+        """
+        在后台线程发起一次刷新(调用方持有锁)；已有刷新在进行时直接复用它。
+        刷新总在线程池里执行，调用方只等 Event，等待时间由调用方决定
+        return: 刷新完成的 Event
+        """
+        if entry.refresh_done is not None:
+            return entry.refresh_done
+        done = threading.Event()
+        entry.refresh_done = done
+        entry.last_attempt = time.monotonic()
+        self._executor.submit(self._refresh, entry, done)
+        return done
+
+    def get_weather_str(self, city=None, timeout=6):
+        """
+        返回天气字符串，如 “晴 18℃”：
+          - 数据未过期：直接返回
+          - 数据已过期：返回旧数据，并在后台刷新
+          - 完全没有数据：等待一次刷新(最多 timeout 秒)，失败返回默认天气
+        """
+        with self._lock:
+            entry = self._entry(city or self.default_city)
+            if not entry.loaded:
+                self._load_local(entry)
+            if self._is_fresh(entry):
+                metrics.inc("weather_cache", result="hit")
+                return entry.weather_str
+            if entry.weather_str is not None:
+                metrics.inc("weather_cache", result="stale")
+                if entry.refresh_done is None and self._can_refresh(entry):
+                    print(f"{entry.city} 天气数据已过期，后台更新，先使用旧数据。")
+                    self._start_refresh(entry)
+                return entry.weather_str
+            # 没有任何可用数据，只能等刷新结果(最多 timeout 秒，超时后刷新继续在后台进行)
+            metrics.inc("weather_cache", result="miss")
+            if entry.refresh_done is None and not self._can_refresh(entry):
+                return DEFAULT_WEATHER_STR
+            done = self._start_refresh(entry)
+
+        done.wait(timeout)
+        with self._lock:
+            return entry.weather_str or DEFAULT_WEATHER_STR
+
+    def get_many(self, cities=None):
+        """
+        一次取多个城市的天气，return {adcode: 天气字符串}。
+        过期或缺失的城市统一放到后台并发刷新，这次先返回旧数据/默认天气
+        """
+        result = {}
+        with self._lock:
+            for city in cities or list(self._entries):
+                entry = self._entry(city)
+                if not entry.loaded:
+                    self._load_local(entry)
+                if not self._is_fresh(entry) and entry.refresh_done is None and self._can_refresh(entry):
+                    self._start_refresh(entry)
+                result[city] = entry.weather_str or DEFAULT_WEATHER_STR
+        return result
+
+    def refresh_cities(self, cities=None, timeout=None):
+        """
+        并发刷新多个城市(和正在进行的刷新合并)，等待全部完成，
+        return {adcode: 最新天气字符串}
+        """
+        waits = []
+        with self._lock:
+            entries = [self._entry(c) for c in (cities or list(self._entries))]
+            for entry in entries:
+                # 先读本地 JSON：强制刷新失败(比如启动时没网)时还能用上次保存的数据
+                if not entry.loaded:
+                    self._load_local(entry)
+                waits.append(self._start_refresh(entry))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for done in waits:
+            done.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            return {entry.city: entry.weather_str or DEFAULT_WEATHER_STR for entry in entries}
+
+    def refresh_now(self, city=None):
+        """
+        强制同步刷新一个城市(合并到正在进行的刷新)，返回最新天气字符串
+        """
+        return self.refresh_cities([city or self.default_city])[city or self.default_city]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_weather_cache():
+    """
+    获取进程内共享的天气缓存(main.py 和 GUI 共用)
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = WeatherCache(cities=WEATHER_CITIES)
+    return _default_cache
+
+
+@metrics.timed("weather_get")
+def get_weather_info(city=None):
+    """
+    获取天气信息，返回 “霾 9℃” / “晴 25℃” 等，见 WeatherCache.get_weather_str
+    city 为空时取默认城市
+    """
+    return get_weather_cache().get_weather_str(city)
+
+
+def get_weather_infos(cities=None):
+    """
+    批量获取多个城市的天气，return {adcode: 天气字符串}
+    """
+    return get_weather_cache().get_many(cities)